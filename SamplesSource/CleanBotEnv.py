@@ -68,10 +68,21 @@ class CleanBotEnv(Env):
         self.observation_space = spaces.Box(low=0, high=2, shape=(self.width, self.width), dtype=np.int)
         self.reset()
 
-    def reset(self):
+    def reset(self, initial_state=None):
+        """
+        Start a new episode
+
+        :param initial_state: The state of the grid to start from, as stored in self.state. If not given, a random grid
+            is generated.
+        """
         self.step_count = 0
         self.bot_x = 0
         self.bot_y = 0
+        if initial_state is not None:
+            self.state = np.array(initial_state, dtype=np.int)
+            self.dirty_count = int(np.count_nonzero(self.state == self.TileState.DIRTY.value))
+            return self._get_obs()
+
         self.state = np.zeros(shape=(self.width, self.width), dtype=np.int)
 
         # Maximum number of cells to mark dirty as a percentage of the total number of cells
@@ -135,3 +146,129 @@ class CleanBotEnv(Env):
         if full_state[self.bot_y, self.bot_x] != self.TileState.DIRTY.value:
             full_state[self.bot_y, self.bot_x] = self.TileState.BOT.value
         return full_state
+
+
+class VecCleanBotEnv:
+    """
+    Steps num_envs independent Clean Bot grids at once. All grids are kept in a single (num_envs, width, width) array
+    and the bot positions in (num_envs,) arrays, such that a step is a handful of array operations regardless of the
+    number of environments.
+
+    Environments that finish an episode are reset automatically. Resets draw from the global random number generator in
+    the same order as a list of CleanBotEnv instances that are stepped in index order and reset when done, so both
+    produce the same sequence of observations, rewards and dones given the same seed.
+
+    :param width: The width of each grid
+    :param num_envs: The number of grids to step at once
+    :param dirty_rate: Upper bound of dirty cells as percentage of total the number of tiles
+    """
+
+    _NORTH = CleanBotEnv.BotActions.NORTH.value
+    _EAST = CleanBotEnv.BotActions.EAST.value
+    _SOUTH = CleanBotEnv.BotActions.SOUTH.value
+    _WEST = CleanBotEnv.BotActions.WEST.value
+    _CLEAN = CleanBotEnv.BotActions.CLEAN.value
+    _CLEAN_TILE = CleanBotEnv.TileState.CLEAN.value
+    _DIRTY_TILE = CleanBotEnv.TileState.DIRTY.value
+    _BOT_TILE = CleanBotEnv.TileState.BOT.value
+
+    def __init__(self, width, num_envs, dirty_rate=0.5):
+        self.width = width
+        """The width of each grid"""
+
+        self.num_envs = num_envs
+        """The number of grids stepped at once"""
+
+        self.max_steps = width * width * 2
+        """The maximum number of step before an episode terminates"""
+
+        self.dirty_rate = dirty_rate
+        """Upper bound of dirty cells as percentage of total the number of tiles"""
+
+        self.step_count = np.zeros(num_envs, dtype=np.int32)
+        """The number of steps taken in the current episode of each environment"""
+
+        self.bot_x = np.zeros(num_envs, dtype=np.int32)
+        """The horizontal location of the bot in each grid"""
+
+        self.bot_y = np.zeros(num_envs, dtype=np.int32)
+        """The vertical location of the bot in each grid"""
+
+        self.state = np.zeros((num_envs, width, width), dtype=np.int8)
+        """3D numpy array holding the state of each cell of every grid. Does NOT contain the bot state."""
+
+        self.dirty_count = np.zeros(num_envs, dtype=np.int32)
+        """The number of dirty cells currently in each grid"""
+
+        self.action_space = spaces.Discrete(5)
+        """The action space of a single environment"""
+        self.observation_space = spaces.Box(low=0, high=2, shape=(self.width, self.width), dtype=np.int8)
+        """The observation space of a single environment"""
+
+        self._env_index = np.arange(num_envs)
+        self.reset()
+
+    def reset(self):
+        """Reset all environments and return the batch of initial observations."""
+        self._reset_envs(self._env_index)
+        return self._get_obs()
+
+    def step(self, actions):
+        """
+        Perform one action in every environment.
+
+        :param actions: Array of num_envs actions
+        :returns:
+            observations, rewards, dones, info:
+                observations: (num_envs, width, width) array. Environments that finished are already reset and return
+                    the first observation of their next episode.
+                rewards: (num_envs,) array of rewards
+                dones: (num_envs,) boolean array, True for environments whose episode finished in this step
+                info: Dict with key "terminal_observation" holding the observations before the reset, or None if no
+                    episode finished.
+        """
+        actions = np.asarray(actions)
+        self.step_count += 1
+
+        self.bot_y += (actions == self._SOUTH) & (self.bot_y < self.width - 1)
+        self.bot_y -= (actions == self._NORTH) & (self.bot_y > 0)
+        self.bot_x += (actions == self._EAST) & (self.bot_x < self.width - 1)
+        self.bot_x -= (actions == self._WEST) & (self.bot_x > 0)
+
+        cleaned = (actions == self._CLEAN) & (self.state[self._env_index, self.bot_y, self.bot_x] == self._DIRTY_TILE)
+        self.state[self._env_index[cleaned], self.bot_y[cleaned], self.bot_x[cleaned]] = self._CLEAN_TILE
+        self.dirty_count -= cleaned
+        rewards = np.where(cleaned, self.max_steps - self.step_count, 0)
+
+        dones = (self.dirty_count == 0) | (self.step_count == self.max_steps)
+        observations = self._get_obs()
+        info = {"terminal_observation": None}
+        if dones.any():
+            info["terminal_observation"] = observations.copy()
+            done_envs = self._env_index[dones]
+            self._reset_envs(done_envs)
+            observations[done_envs] = self._get_obs()[done_envs]
+        return observations, rewards, dones, info
+
+    def _reset_envs(self, envs):
+        """Reset the environments with the given indices in ascending order."""
+        self.step_count[envs] = 0
+        self.bot_x[envs] = 0
+        self.bot_y[envs] = 0
+        self.state[envs] = self._CLEAN_TILE
+
+        # Draw the dirty cells of all environments with one call. This consumes the random number generator exactly
+        # like CleanBotEnv.reset() called once per environment.
+        dirty_upper_bound = max(1, int(self.width * self.width * self.dirty_rate))
+        dirty_cells = np.random.randint(self.width, size=(len(envs), dirty_upper_bound, 2))
+        env_column = np.repeat(envs, dirty_upper_bound)
+        self.state[env_column, dirty_cells[..., 0].ravel(), dirty_cells[..., 1].ravel()] = self._DIRTY_TILE
+        self.dirty_count[envs] = np.count_nonzero(self.state[envs].reshape(len(envs), -1), axis=1)
+
+    def _get_obs(self):
+        """Convert internal state to observations setting the state of the tile each bot is on."""
+        full_state = self.state.copy()
+        bot_tiles = full_state[self._env_index, self.bot_y, self.bot_x]
+        full_state[self._env_index, self.bot_y, self.bot_x] = np.where(
+            bot_tiles != self._DIRTY_TILE, self._BOT_TILE, bot_tiles)
+        return full_state
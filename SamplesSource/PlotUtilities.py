@@ -4,7 +4,8 @@ import matplotlib.pyplot as plt
 
 class LivePlot:
     """
-    Renders a plot that keeps updating as more data becomes available.
+    Renders a plot that keeps updating as more data becomes available. The source of each figure is either a
+    MetricsLogger or a MetricsFileReader.
     """
     def __init__(self, figures):
         fig, axes = plt.subplots(len(figures), 1)
@@ -21,6 +22,9 @@ class LivePlot:
     def update_plot(self):
         for figure_idx, (figure, ax) in enumerate(zip(self.figures, self.axes)):
             metrics = figure["source"]
+            if hasattr(metrics, "refresh"):
+                # A MetricsFileReader of a running experiment
+                metrics.refresh()
             # min limits of y axis for all plots in this figure
             min_y = float("inf")
             max_y = float("-inf")
@@ -37,12 +41,16 @@ class LivePlot:
             ax.set_xlim(min_x, max_x)
             ax.set_ylim(min_y, max_y)
 
-            # draw all plots in this figure
+            # draw all plots in this figure. Only the visible values are read, which bounds the memory used to plot
+            # the complete history in a metrics file.
+            count = min(metrics.count, self.x_range + 1)
+            x = np.arange(metrics.upper_bound + 1 - count, metrics.upper_bound + 1)
             for plot_idx, plot in enumerate(figure["plots"]):
                 metric = plot["metric"]
+                y = metrics.tail(metric, count)
                 if self.plot_lines[figure_idx][plot_idx]:
-                    self.plot_lines[figure_idx][plot_idx].set_xdata(np.arange(metrics.lower_bound, metrics.upper_bound + 1))
-                    self.plot_lines[figure_idx][plot_idx].set_ydata(metrics.data[metric])
+                    self.plot_lines[figure_idx][plot_idx].set_xdata(x)
+                    self.plot_lines[figure_idx][plot_idx].set_ydata(y)
                 else:
-                    self.plot_lines[figure_idx][plot_idx] = ax.plot(metrics.data[metric], color=plot.get("color", "b"))[0]
+                    self.plot_lines[figure_idx][plot_idx] = ax.plot(x, y, color=plot.get("color", "b"))[0]
         self.fig.canvas.draw()
\ No newline at end of file
@@ -1,9 +1,16 @@
-from Utilities.Eval import validate_policy
+from Utilities.Eval import validate_policy, validate_policy_sequential, ValidationPool, ValidationSet, ValidationResult
 from gym import Env
 from Model import Model
 from Policies import Policy
 
 from typing import List, Dict, Callable
+import functools
+import hashlib
+import inspect
+import json
+import types
+
+import numpy as np
 
 
 class Experiment:
@@ -20,13 +27,41 @@ class Experiment:
         self.testing_policy = testing_policy
         self.method = method
         self.name = type(self).__name__
+        self.validation_set: ValidationSet = None
+        """The initial states validation episodes start from. Random initial states are used if None."""
+
+    def validate(self, episode_count=200, workers=None):
+        return validate_policy(self.env, self.testing_policy, episode_count=episode_count, workers=workers,
+                               validation_set=self.validation_set)
+
+    def validate_sequential(self, ci_half_width, confidence=0.95, min_episode_count=30, max_episode_count=1000):
+        return validate_policy_sequential(self.env, self.testing_policy, ci_half_width, confidence=confidence,
+                                          min_episode_count=min_episode_count, max_episode_count=max_episode_count,
+                                          validation_set=self.validation_set)
+
 
-    def validate(self, episode_count=200):
-        return validate_policy(self.env, self.testing_policy, episode_count=episode_count)
+def encode_config_value(value):
+    """
+    Encode a value of an experiment configuration that JSON does not support, such that the encoding is the same in
+    every run. NumPy scalars are encoded by their value, functions and classes by their qualified name and partial
+    functions by their function and arguments. Raises TypeError for any other value, and for lambdas and functions
+    defined inside other functions, since their names do not identify them.
+    """
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, functools.partial):
+        return {"partial": value.func, "args": value.args, "keywords": value.keywords}
+    if isinstance(value, (type, types.FunctionType, types.BuiltinFunctionType)):
+        if "<lambda>" in value.__qualname__ or "<locals>" in value.__qualname__:
+            raise TypeError(f"Cannot identify {value.__qualname__} by its name in an experiment configuration")
+        return f"{value.__module__}.{value.__qualname__}"
+    raise TypeError(f"Cannot encode {type(value).__name__} in an experiment configuration: {value!r}")
 
 
 class Suite:
-    def __init__(self, episode_count, validation_frequency, validation_episode_count):
+    def __init__(self, episode_count, validation_frequency, validation_episode_count, validation_workers=None,
+                 use_validation_set=False, validation_ci_half_width=None, validation_confidence=0.95,
+                 validation_min_episode_count=30, random_seed=643674):
         self.experiments: [Experiment] = []
         self.episode_count = episode_count
         """"Number of episodes to train for. """
@@ -35,10 +70,86 @@ class Suite:
         """Number of training episodes after which to run the validation episodes again"""
 
         self.validation_episode_count = validation_episode_count
-        """Number of episodes in the validation set"""
+        """Number of episodes in the validation set. The maximum number if validation_ci_half_width is set."""
+
+        self.validation_workers = validation_workers
+        """Number of processes that run the validation episodes in parallel. See validate_policy."""
+
+        self.use_validation_set = use_validation_set
+        """Generate the initial states of the validation episodes once per experiment. See ValidationSet."""
+
+        self.validation_ci_half_width = validation_ci_half_width
+        """
+        If set, validation stops as soon as the confidence interval of the average reward has at most this half width.
+        See validate_policy_sequential.
+        """
+
+        self.validation_confidence = validation_confidence
+        """Confidence level of the interval used to stop validation"""
+
+        self.validation_min_episode_count = validation_min_episode_count
+        """Number of validation episodes that are always run if validation_ci_half_width is set"""
+
+        self.random_seed = random_seed
+        """The random number generator is seeded with it before each experiment is created and before it is trained"""
+
+        self.results_directory = "results"
+        """Directory holding the results of experiments that have a key. See experiment_key."""
 
-    def validate(self, experiment: Experiment):
-        return experiment.validate(episode_count=self.validation_episode_count)
+        self.validation_pool: ValidationPool = None
+        """
+        Worker processes that run the validation episodes in place of forking validation_workers processes for every
+        validation. Set by ExperimentRunner.run_experiment_suite for the duration of a run.
+        """
+
+    def experiment_config(self, index):
+        """
+        Return a dict that describes everything the results of experiment index depend on, or None if the experiment
+        cannot be described. The base class cannot describe its experiments.
+        """
+        return None
+
+    def experiment_key(self, index):
+        """
+        Return a key that identifies the configuration of experiment index, or None if the experiment has no
+        configuration or it contains values encode_config_value cannot encode. The results of an experiment are stored
+        under its key and an experiment whose key has complete results is not run again. Experiments without a key are
+        always run. See ExperimentRunner.run_experiment.
+        """
+        config = self.experiment_config(index)
+        if config is None:
+            return None
+        try:
+            encoded_config = json.dumps(config, sort_keys=True, default=encode_config_value)
+        except TypeError:
+            return None
+        return hashlib.sha256(encoded_config.encode()).hexdigest()[:16]
+
+    def _settings(self):
+        """The settings of the suite that affect the results of every experiment"""
+        return {name: getattr(self, name) for name in (
+            "episode_count", "validation_frequency", "validation_episode_count", "validation_workers",
+            "use_validation_set", "validation_ci_half_width", "validation_confidence", "validation_min_episode_count",
+            "random_seed")}
+
+    def validate(self, experiment: Experiment) -> float:
+        """Return the average reward of the testing policy of the experiment. See validate_with_interval."""
+        return self.validate_with_interval(experiment).mean
+
+    def validate_with_interval(self, experiment: Experiment) -> ValidationResult:
+        """
+        Validate the testing policy of the experiment and return the average reward together with the half width of its
+        confidence interval and the number of episodes run. The half width is NaN unless validation_ci_half_width is
+        set.
+        """
+        if self.use_validation_set and experiment.validation_set is None:
+            experiment.validation_set = ValidationSet.generate(experiment.env, self.validation_episode_count)
+        if self.validation_ci_half_width is not None:
+            return experiment.validate_sequential(self.validation_ci_half_width, self.validation_confidence,
+                                                  self.validation_min_episode_count, self.validation_episode_count)
+        workers = self.validation_workers if self.validation_pool is None else self.validation_pool
+        average = experiment.validate(episode_count=self.validation_episode_count, workers=workers)
+        return ValidationResult(average, float("nan"), self.validation_episode_count)
 
 
 class DefaultSuite(Suite):
@@ -47,7 +158,13 @@ class DefaultSuite(Suite):
                  experiment_args: List[Dict[str, None]],
                  episode_count: int,
                  validation_frequency: int,
-                 validation_episode_count: int):
+                 validation_episode_count: int,
+                 validation_workers: int = None,
+                 use_validation_set: bool = False,
+                 validation_ci_half_width: float = None,
+                 validation_confidence: float = 0.95,
+                 validation_min_episode_count: int = 30,
+                 random_seed: int = 643674):
         """
         Suite that uses a factory function that creates Experiment instances and a list of dictionaries that provides
         arguments to pass to the factory function.
@@ -57,11 +174,39 @@ class DefaultSuite(Suite):
         :param episode_count: The number of episodes to trains for
         :param validation_frequency: Number of training episodes after which to run the validation episodes again
         :param validation_episode_count: Number of episodes in the validation set
+        :param validation_workers: Number of processes that run the validation episodes in parallel. See
+            validate_policy.
+        :param use_validation_set: Generate the initial states of the validation episodes once per experiment
+        :param validation_ci_half_width: If set, validation stops as soon as the confidence interval of the average
+            reward has at most this half width
+        :param validation_confidence: Confidence level of the interval used to stop validation
+        :param validation_min_episode_count: Number of validation episodes that are always run if
+            validation_ci_half_width is set
+        :param random_seed: The random number generator is seeded with it before each experiment is created and
+            before it is trained
         """
 
-        super().__init__(episode_count, validation_frequency, validation_episode_count)
+        super().__init__(episode_count, validation_frequency, validation_episode_count, validation_workers,
+                         use_validation_set, validation_ci_half_width, validation_confidence,
+                         validation_min_episode_count, random_seed)
+        self.factory_function = factory_function
         self.experiment_args = experiment_args
         self.experiments = [
             lambda args_dict=experiment: factory_function(**args_dict) for experiment in experiment_args
         ]
 
+    def experiment_config(self, index):
+        """
+        Describe experiment index by the factory function, including its source code, the arguments passed to it and
+        the settings of the suite. Changes to code called by the factory function are not detected.
+        """
+        try:
+            source = inspect.getsource(self.factory_function)
+        except (OSError, TypeError):
+            source = None
+        return {
+            "factory": f"{self.factory_function.__module__}.{self.factory_function.__qualname__}",
+            "factory_source": source,
+            "args": self.experiment_args[index],
+            "settings": self._settings(),
+        }
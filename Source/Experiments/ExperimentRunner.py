@@ -3,72 +3,291 @@ Experiment Runner
 =================
 Runs a suite of experiments. See SamplesSource/TableVsDeepModel.py for an example.
 
-Usage: ExperimentRunner <experiments module>
+Usage: ExperimentRunner <experiments module> [--workers N] [--resume]
     experiments module      Name of a module on the PYTHONPATH that defines a experiment_suite() function
+    --workers N             Run the experiments in parallel on N processes
+    --resume                Skip completed experiments and continue interrupted ones from their last checkpoint
 
 TODO: Document properly
 """
 
 import numpy as np
-from Utilities.Eval import MetricsLogger
+from Utilities.Eval import MetricsLogger, ValidationPool
 from console_progressbar import ProgressBar
-import sys
+import argparse
 import importlib
-from Experiments.Experiment import Experiment, Suite
+import json
+import multiprocessing
+import os
+import pickle
+import queue
+import signal
+from Experiments.Experiment import Experiment, Suite, encode_config_value
 
 
-def run_experiment_module(suite_module_name):
+def run_experiment_module(suite_module_name, workers=None, resume=False):
     module = importlib.import_module(suite_module_name)
     suite: Suite = module.experiment_suite()
-    run_experiment_suite(suite)
+    run_experiment_suite(suite, workers, resume)
 
 
-def run_experiment_suite(suite):
-    class ValidationMetrics:
-        def __init__(self):
-            self.training_avg_reward = 0.0
-            self.validation_avg_reward = 0.0
+class ValidationMetrics:
+    def __init__(self):
+        self.training_avg_reward = 0.0
+        self.validation_avg_reward = 0.0
+        self.validation_ci_half_width = 0.0
+        self.validation_episode_count = 0
 
-    np.random.seed(643674)
+
+def run_experiment(suite: Suite, index, progress=None, resume=False):
+    """
+    Create, train and validate experiment index of the suite and save its results.
+
+    The random number generator is seeded with suite.random_seed before the experiment is created and again before it
+    is trained, such that every experiment starts with the same sequence of random numbers, no matter which process
+    runs it and which experiments ran before.
+
+    At every validation point, the experiment, the metrics logs and the state of the random number generator are
+    saved to a checkpoint file. A completed experiment is marked in the same file.
+
+    If the suite provides a key for the experiment (see Suite.experiment_key), all files are stored in the directory
+    <suite.results_directory>/<key>, together with the configuration of the experiment in config.json and, once the
+    experiment has completed, its result in the file COMPLETE. An experiment whose directory holds a COMPLETE file
+    is not run again. The checkpoint is stored as checkpoint.pkl in the same directory, so an experiment is only
+    created if it is not resumed from a checkpoint.
+
+    Experiments without a key store their files in the working directory and their checkpoint in
+    <experiment name>-checkpoint.pkl. They are always created to find their checkpoint by their name.
+
+    :param progress: Called with the name of the experiment and the index of every episode after it has been run
+    :param resume: If the experiment has a checkpoint, skip it if it has completed, and otherwise continue training
+        from the checkpoint instead of starting over
+    :returns: The name of the experiment and its last average validation reward
+    """
+    key = suite.experiment_key(index)
+    directory = "" if key is None else os.path.join(suite.results_directory, key)
+    complete_file = os.path.join(directory, "COMPLETE")
+    if key is not None and os.path.exists(complete_file):
+        with open(complete_file) as f:
+            result = json.load(f)
+        if progress is not None:
+            progress(result["name"], suite.episode_count - 1)
+        return result["name"], result["validation_avg_reward"]
+
+    checkpoint = None
+    if key is not None:
+        checkpoint_file = os.path.join(directory, "checkpoint.pkl")
+        if resume:
+            checkpoint = _load_checkpoint(checkpoint_file)
+    if checkpoint is None:
+        np.random.seed(suite.random_seed)
+        experiment: Experiment = suite.experiments[index]()
+        np.random.seed(suite.random_seed)
+        if key is None:
+            checkpoint_file = f"{experiment.name}-checkpoint.pkl"
+            if resume:
+                checkpoint = _load_checkpoint(checkpoint_file)
+                if checkpoint is not None:
+                    experiment.model.close()
+
+    if checkpoint is not None:
+        if checkpoint["complete"]:
+            if progress is not None:
+                progress(checkpoint["name"], suite.episode_count - 1)
+            return checkpoint["name"], checkpoint["validation_avg_reward"]
+        experiment = checkpoint["experiment"]
+        path_prefix = os.path.join(directory, experiment.name)
+        first_episode = checkpoint["episode"]
+        training_metrics_log = checkpoint["training_metrics_log"]
+        validation_metrics = checkpoint["validation_metrics"]
+        validation_metrics_log = checkpoint["validation_metrics_log"]
+        np.random.set_state(checkpoint["random_state"])
+    else:
+        if key is not None:
+            os.makedirs(directory, exist_ok=True)
+            with open(os.path.join(directory, "config.json"), "w") as f:
+                json.dump(suite.experiment_config(index), f, indent=4, sort_keys=True, default=encode_config_value)
+        path_prefix = os.path.join(directory, experiment.name)
+        first_episode = 0
+        # The complete history of all metrics is streamed to files that can be opened with MetricsFileReader
+        training_metrics_log = MetricsLogger(experiment.method.metrics, max_length=100000,
+                                             rolling_window=suite.validation_frequency,
+                                             file=f"{path_prefix}-training_metrics.bin")
+        validation_metrics = ValidationMetrics()
+        validation_metrics_log = MetricsLogger(validation_metrics, max_length=10000,
+                                               file=f"{path_prefix}-validation_metrics.bin", chunk_size=64)
+
+    try:
+        for i in range(first_episode, suite.episode_count):
+            reward = experiment.method.run_episode()
+            if progress is not None:
+                progress(experiment.name, i)
+            # print(f" - {reward:.2f}", end="")
+            training_metrics_log.append(experiment.method.metrics)
+
+            #
+            if i % suite.validation_frequency == suite.validation_frequency - 1:
+                validation_metrics.training_avg_reward = training_metrics_log.rolling_mean["episode_reward"]
+                validation = suite.validate_with_interval(experiment)
+                validation_metrics.validation_avg_reward = validation.mean
+                validation_metrics.validation_ci_half_width = validation.ci_half_width
+                validation_metrics.validation_episode_count = validation.episode_count
+                validation_metrics_log.append(validation_metrics)
+                _save_checkpoint(checkpoint_file, {
+                    "complete": False,
+                    "episode": i + 1,
+                    "experiment": experiment,
+                    "training_metrics_log": training_metrics_log,
+                    "validation_metrics": validation_metrics,
+                    "validation_metrics_log": validation_metrics_log,
+                    "random_state": np.random.get_state(),
+                })
+        experiment.model.save(f"{path_prefix}-model")
+    finally:
+        training_metrics_log.close()
+        validation_metrics_log.close()
+        # Stops the background threads of the model, if any
+        experiment.model.close()
+
+    for metric in ("validation_avg_reward", "validation_ci_half_width", "validation_episode_count"):
+        np.save(f"{path_prefix}-{metric}.npy", validation_metrics_log.data[metric])
+    _save_checkpoint(checkpoint_file, {"complete": True, "name": experiment.name,
+                                       "validation_avg_reward": validation_metrics.validation_avg_reward})
+    if key is not None:
+        _write_atomically(complete_file, json.dumps({
+            "name": experiment.name,
+            "validation_avg_reward": validation_metrics.validation_avg_reward,
+        }).encode())
+    return experiment.name, validation_metrics.validation_avg_reward
+
+
+def _load_checkpoint(file):
+    """Return the checkpoint saved to file, or None if there is none"""
+    if not os.path.exists(file):
+        return None
+    with open(file, "rb") as f:
+        return pickle.load(f)
+
+
+def _save_checkpoint(file, checkpoint):
+    # The metrics files must hold all rows of the pickled logs, pickling does not write them
+    for value in checkpoint.values():
+        if isinstance(value, MetricsLogger):
+            value.flush()
+    _write_atomically(file, pickle.dumps(checkpoint, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+def _write_atomically(file, data):
+    """Replace the file with data atomically, such that an interruption never leaves a partially written file"""
+    temporary_file = file + ".tmp"
+    with open(temporary_file, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary_file, file)
+
+
+def run_experiment_suite(suite, workers=None, resume=False):
+    """
+    Run all experiments of the suite.
+
+    :param workers: If given, the experiments are run by a pool of this many forked processes. Since the processes of
+        a pool cannot start processes themselves, suite.validation_workers must not be set in this case.
+    :param resume: Skip experiments that have completed in a previous run and continue partially trained ones from
+        their last checkpoint. See run_experiment.
+    """
+    if workers is not None:
+        assert suite.validation_workers is None, "validation_workers cannot be used when running experiments in a pool"
+        return _run_experiment_suite_parallel(suite, workers, resume)
+
+    def print_progress(name, episode):
+        if name not in progress_bars:
+            progress_bars[name] = ProgressBar(total=suite.episode_count, prefix=f"{name}", length=50, fill='X')
+        progress_bars[name].print_progress_bar(episode)
+
+    progress_bars = {}
+    if suite.validation_workers is not None and suite.validation_workers > 1:
+        # Started once for all experiments instead of forking new processes at every validation
+        suite.validation_pool = ValidationPool(suite.validation_workers)
     try:
-        random_state = np.random.get_state()
-        for experiment_constructor in suite.experiments:
-            experiment: Experiment = experiment_constructor()
-            # Restore the initial state of the random number generator such that every experiment start with the same
-            # sequence or random numbers
-            np.random.set_state(random_state)
-            training_metrics_log = MetricsLogger(experiment.method.metrics, max_length=100000)
-            validation_metrics = ValidationMetrics()
-            validation_metrics_log = MetricsLogger(validation_metrics, max_length=10000)
-
-            pb = ProgressBar(total=suite.episode_count, prefix=f"{experiment.name}", length=50, fill='X')
-            pb.print_progress_bar(0)
-            for i in range(suite.episode_count):
-                reward = experiment.method.run_episode()
-                pb.print_progress_bar(i)
-                # print(f" - {reward:.2f}", end="")
-                training_metrics_log.append(experiment.method.metrics)
-
-                #
-                if i % suite.validation_frequency == suite.validation_frequency - 1:
-                    validation_metrics.training_avg_reward = np.average(
-                        training_metrics_log.data["episode_reward"][-suite.validation_frequency:])
-                    validation_metrics.validation_avg_reward = suite.validate(experiment)
-                    validation_metrics_log.append(validation_metrics)
-
-            print(f"\r{experiment.name}: {validation_metrics.validation_avg_reward:>10.3f}")
-            experiment.model.save(f"{experiment.name}-model")
-            np.save(f"{experiment.name}-validation_avg_reward.npy",
-                    validation_metrics_log.data["validation_avg_reward"], )
+        for index in range(len(suite.experiments)):
+            name, validation_avg_reward = run_experiment(suite, index, print_progress, resume)
+            print(f"\r{name}: {validation_avg_reward:>10.3f}")
+    except KeyboardInterrupt:
+        print("Keyboard interrupt")
+    finally:
+        if suite.validation_pool is not None:
+            suite.validation_pool.close()
+            suite.validation_pool = None
+
+
+_suite = None
+"""The suite run by the pool. Inherited by the forked worker processes, so the suite is never pickled."""
 
+_progress_queue = None
+"""Queue the worker processes report progress to"""
+
+
+def _run_experiment_suite_parallel(suite, workers, resume):
+    global _suite, _progress_queue
+    context = multiprocessing.get_context("fork")
+    _suite = suite
+    _progress_queue = context.Queue()
+    pool = context.Pool(workers, initializer=_init_worker)
+    try:
+        results = [pool.apply_async(_run_experiment_in_worker, (index, resume))
+                   for index in range(len(suite.experiments))]
+        total_episodes = len(results) * suite.episode_count
+        episodes = {}
+        pb = ProgressBar(total=total_episodes, prefix=f"{len(results)} experiments", length=50, fill='X')
+        pending = list(results)
+        while pending:
+            try:
+                index, episode_count = _progress_queue.get(timeout=0.5)
+                episodes[index] = episode_count
+                pb.print_progress_bar(sum(episodes.values()))
+            except queue.Empty:
+                pass
+            for result in [result for result in pending if result.ready()]:
+                pending.remove(result)
+                # Raises the exception of the experiment, if any
+                name, validation_avg_reward = result.get()
+                print(f"\r{name}: {validation_avg_reward:>10.3f}")
+        pool.close()
     except KeyboardInterrupt:
         print("Keyboard interrupt")
+        pool.terminate()
+    except BaseException:
+        # Stop the remaining experiments, join() would wait for them otherwise
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+        _suite = None
+        _progress_queue = None
 
 
-if __name__ == '__main__':
-    args = [arg for arg in sys.argv[1:] if not arg.startswith("-")]
+def _init_worker():
+    # Only the parent process handles keyboard interrupts and terminates the pool
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
 
-    if len(args) == 0:
-        raise SystemExit(f"Usage: {sys.argv[0]} <experiments module>")
+def _run_experiment_in_worker(index, resume):
+    report_every = max(1, _suite.episode_count // 100)
 
-    run_experiment_module(args[0])
+    def report_progress(name, episode):
+        if (episode + 1) % report_every == 0 or episode + 1 == _suite.episode_count:
+            _progress_queue.put((index, episode + 1))
+
+    return run_experiment(_suite, index, report_progress, resume)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Runs a suite of experiments")
+    parser.add_argument("module", help="Name of a module on the PYTHONPATH that defines a experiment_suite() function")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Run the experiments in parallel on this many processes")
+    parser.add_argument("--resume", action="store_true",
+                        help="Skip completed experiments and continue interrupted ones from their last checkpoint")
+    args = parser.parse_args()
+    run_experiment_module(args.module, args.workers, args.resume)
@@ -0,0 +1,134 @@
+"""
+ActorLearner
+============
+
+Runs monte carlo methods on several processes that share a table model, so training uses all cores of a machine.
+"""
+
+import multiprocessing
+import traceback
+
+import numpy as np
+
+import Utilities.Env as envutil
+from Methods.MonteCarlo import AlphaMC
+from Models.SharedTableModel import SharedTableModel
+from Policies import EpsilonGreedyPolicy
+
+HOGWILD = "hogwild"
+"""Every actor applies the updates of its own episodes to the shared table"""
+
+LEARNER = "learner"
+"""Actors only record episodes. The process that runs the method applies all updates."""
+
+
+class ActorLearnerMC:
+    """
+    Runs AlphaMC with several actor processes that record episodes with an epsilon greedy policy on a shared table.
+
+    In HOGWILD mode every actor updates the shared table itself without any locking. Two actors that update the same
+    state-action pair at the same time may lose one of the updates, which rarely happens since each episode only
+    updates a small part of the table. In LEARNER mode the actors send their episodes to the calling process, which
+    applies all updates, so no update is lost, but the learner may become the bottleneck.
+
+    The actors are started by the first call to run_episode() and run ahead of the caller by at most a few episodes
+    each. Call close() to stop them.
+
+    :param env_factory: Creates the environment of every actor. Must be picklable if processes are spawned.
+    :param model: The shared table
+    :param exploration: The exploration rate of the epsilon greedy policies of the actors
+    :param alpha: The step size of the AlphaMC updates
+    :param actor_count: The number of actor processes. Defaults to the number of cores.
+    :param mode: HOGWILD or LEARNER
+    :param seed: The seeds of the random number generators of the actors are derived from it
+    """
+
+    def __init__(self, env_factory, model: SharedTableModel, exploration=0.1, alpha=0.005, actor_count=None,
+                 mode=HOGWILD, seed=None):
+        assert mode in (HOGWILD, LEARNER), f"Unknown mode {mode}"
+        self.model = model
+        self.mode = mode
+        self.actor_count = actor_count or multiprocessing.cpu_count()
+
+        self._env_factory = env_factory
+        self._exploration = exploration
+        env = env_factory()
+        self._learner = AlphaMC(env, model, EpsilonGreedyPolicy(model, exploration))
+        self._learner.alpha = alpha
+        self._episode = envutil.EpisodeBuffer(env)
+        self._seeds = np.random.SeedSequence(seed).generate_state(self.actor_count)
+        self._results = None
+        self._stop = None
+        self._actors = []
+
+    @property
+    def metrics(self):
+        """The AlphaMCMetrics of the last episode returned by run_episode()"""
+        return self._learner.metrics
+
+    def run_episode(self):
+        """Wait for the next episode finished by any of the actors and return its total reward"""
+        if not self._actors:
+            self._start()
+        message = self._results.get()
+        if isinstance(message, str):
+            self.close()
+            raise RuntimeError(f"Actor failed:\n{message}")
+
+        if self.mode == LEARNER:
+            self._episode.clear()
+            self._episode.extend(*message)
+            return self._learner.learn_from_episode(self._episode)
+
+        metrics = self._learner.metrics
+        metrics.episode_reward, metrics.max_action_value_delta, metrics.rms = message
+        return metrics.episode_reward
+
+    def close(self):
+        """Stop all actors and wait until they have terminated"""
+        if not self._actors:
+            return
+        self._stop.set()
+        for actor in self._actors:
+            # Actors may be blocked on the full result queue
+            while actor.is_alive():
+                while not self._results.empty():
+                    self._results.get()
+                actor.join(0.1)
+        self._actors = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _start(self):
+        self._results = multiprocessing.Queue(maxsize=4 * self.actor_count)
+        self._stop = multiprocessing.Event()
+        for seed in self._seeds.tolist():
+            actor = multiprocessing.Process(target=_run_actor, daemon=True,
+                                            args=(self._env_factory, self.model, self._exploration,
+                                                  self._learner.alpha, self.mode == HOGWILD, seed, self._results,
+                                                  self._stop))
+            actor.start()
+            self._actors.append(actor)
+
+
+def _run_actor(env_factory, model, exploration, alpha, update_model, seed, results, stop):
+    """Main function of an actor process. Records episodes and reports them or their metrics to results until stopped."""
+    try:
+        np.random.seed(seed)
+        env = env_factory()
+        method = AlphaMC(env, model, EpsilonGreedyPolicy(model, exploration))
+        method.alpha = alpha
+        episode = envutil.EpisodeBuffer(env)
+        while not stop.is_set():
+            envutil.record_episode(env, method.policy, episode=episode)
+            if update_model:
+                method.learn_from_episode(episode)
+                results.put((method.metrics.episode_reward, method.metrics.max_action_value_delta, method.metrics.rms))
+            else:
+                results.put((episode.obs.copy(), episode.actions.copy(), episode.rewards.copy(), episode.done.copy()))
+    except Exception:
+        results.put(traceback.format_exc())
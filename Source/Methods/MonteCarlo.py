@@ -41,35 +41,39 @@ class AveragingMC:
         self.env = env
         self.model = model
         self.policy = policy
-        self.total_returns = np.zeros(envutil.obs_action_shape(env), dtype=np.int32)
-        self.visit_count = np.zeros(envutil.obs_action_shape(env), dtype=np.int32)
+        state_action_count = envutil.state_count(env) * env.action_space.n
+        self.total_returns = np.zeros(state_action_count, dtype=np.int32)
+        """Sum of the first-visit returns of each state-action pair, indexed by state-action key"""
+        self.visit_count = np.zeros(state_action_count, dtype=np.int32)
+        """Number of episodes in which each state-action pair was visited, indexed by state-action key"""
         self.metrics = AveragingMcMetrics()
+        self._episode = envutil.EpisodeBuffer(env)
 
     def run_episode(self):
-        episode = envutil.record_episode(self.env, self.policy)
-        first_visit_rewards, total_reward = envutil.first_visit_rewards(episode)
-        max_delta = 0
+        episode = envutil.record_episode(self.env, self.policy, episode=self._episode)
+        steps, returns, total_reward = envutil.first_visit_returns(episode)
+        states, actions = episode.obs[steps], episode.actions[steps]
+        keys = episode.state_action_keys()[steps]
+
+        # Integrate new data
+        np.add.at(self.total_returns, keys, returns.astype(self.total_returns.dtype))
+        np.add.at(self.visit_count, keys, 1)
+
+        # Calculate model update
+        visit_count = self.visit_count[keys]
+        updated_action_values = self.total_returns[keys] / visit_count
 
-        for state, action, reward in first_visit_rewards:
-            state_action_index = envutil.to_table_index(state, action)
-            # Integrate new data
-            self.total_returns[state_action_index] += reward
-            self.visit_count[state_action_index] += 1
-
-            # Calculate model update
-            visit_count = self.visit_count[state_action_index]
-            updated_action_value = self.total_returns[state_action_index] / visit_count
-
-            # Calculate metrics
-            if visit_count == 1:
-                self.metrics.first_time_visited += 1
-            else:
-                max_delta = max(max_delta, abs(self.model.action_value(state, action) - updated_action_value))
-            if visit_count == 5:
-                self.metrics.fifth_time_visited += 1
-
-            # Update the model
-            self.model.update_action_value(state, action, updated_action_value)
+        # Calculate metrics
+        revisited = visit_count > 1
+        max_delta = 0
+        if np.any(revisited):
+            max_delta = np.max(np.abs(self.model.action_values_batch(states[revisited], actions[revisited]) -
+                                      updated_action_values[revisited]))
+        self.metrics.first_time_visited += len(keys) - np.count_nonzero(revisited)
+        self.metrics.fifth_time_visited += np.count_nonzero(visit_count == 5)
+
+        # Update the model
+        self.model.update_action_values_batch(states, actions, updated_action_values)
         self.metrics.episode_reward = total_reward
         self.metrics.max_action_value_delta = max_delta
         return total_reward
@@ -103,19 +107,22 @@ class AlphaMC:
         self.policy = policy
         self.alpha = 0.005
         self.metrics = AlphaMCMetrics()
+        self._episode = envutil.EpisodeBuffer(env)
 
     def run_episode(self):
-        episode = envutil.record_episode(self.env, self.policy)
-        first_visit_rewards, total_reward = envutil.first_visit_rewards(episode)
-        max_delta = 0
-        squared_residuals = 0
-        for state, action, observed_reward in first_visit_rewards:
-            predicted_reward = self.model.action_value(state, action)
-            action_value_delta = self.alpha * (observed_reward - predicted_reward)
-            squared_residuals += (observed_reward - predicted_reward)**2
-            max_delta = max(max_delta, abs(action_value_delta))
-            self.model.update_action_value(state, action, predicted_reward + action_value_delta)
+        return self.learn_from_episode(envutil.record_episode(self.env, self.policy, episode=self._episode))
+
+    def learn_from_episode(self, episode: envutil.EpisodeBuffer):
+        """Update the model with an episode that has already been recorded and return its total reward"""
+        steps, observed_rewards, total_reward = envutil.first_visit_returns(episode)
+        states, actions = episode.obs[steps], episode.actions[steps]
+
+        predicted_rewards = self.model.action_values_batch(states, actions)
+        residuals = observed_rewards - predicted_rewards
+        action_value_deltas = self.alpha * residuals
+        self.model.update_action_values_batch(states, actions, predicted_rewards + action_value_deltas)
+
         self.metrics.episode_reward = total_reward
-        self.metrics.max_action_value_delta = max_delta
-        self.metrics.rms = sqrt(squared_residuals / len(first_visit_rewards))
+        self.metrics.max_action_value_delta = np.max(np.abs(action_value_deltas))
+        self.metrics.rms = sqrt(np.mean(residuals ** 2))
         return total_reward
@@ -1,3 +1,7 @@
+import numpy as np
+from collections import deque
+
+import Utilities.Env as envutil
 from Model import Model
 from Policies import EpsilonGreedyPolicy
 
@@ -52,3 +56,254 @@ class Sarsa:
 
         self.metrics.max_action_value_delta = max_delta
         return self.metrics.episode_reward
+
+
+class SarsaLambda:
+    """
+    Sarsa(lambda): every step updates all recently visited state-action pairs in proportion to their eligibility
+    trace. This propagates delayed rewards much faster than one-step Sarsa.
+
+    Traces are kept only for the active state-action pairs. They decay by gamma * trace_decay per step and are dropped
+    once they fall below trace_threshold, so the number of pairs updated per step stays bounded. All active pairs are
+    updated with a single increment_action_values_batch call. The next state is evaluated once and its values are
+    used both to choose the next action and to compute the target.
+
+    :param trace_decay: The lambda parameter. 0 is one-step Sarsa, 1 approaches Monte Carlo
+    :param trace_threshold: Traces below this value are dropped
+    :param replacing_traces: Reset the trace of a revisited state-action pair to 1 instead of incrementing it
+    """
+
+    def __init__(self, env, model: Model, policy: EpsilonGreedyPolicy, alpha=0.01, gamma=0.9, trace_decay=0.8,
+                 trace_threshold=0.01, replacing_traces=True):
+        self.env = env
+        self.model = model
+        self.policy = policy
+        self.alpha = alpha
+        self.gamma = gamma
+        self.trace_decay = trace_decay
+        self.trace_threshold = trace_threshold
+        self.replacing_traces = replacing_traces
+        self.metrics = SarsaMetrics()
+        # Other models accept observations that may not fit into state ids
+        self._weights = envutil.obs_weights(env) if model.accepts_state_ids else None
+        self._action_count = env.action_space.n
+        self._state_keys = {}
+        """The bytes of each observation of the current episode -> number used for its state-action keys"""
+
+    def run_episode(self):
+        self._state_keys.clear()
+        state_0, key_base_0 = self._encode(self.env.reset())
+        action_0 = self.policy.choose_action_from_values(self.model.state_values(state_0))
+        value_0 = self.model.action_value(state_0, action_0)
+        self.metrics.episode_reward = 0
+
+        # Active eligibility traces: state-action keys, the states and actions to pass to the model and the traces
+        trace_keys = np.zeros(0, dtype=np.int64)
+        trace_states = []
+        trace_actions = np.zeros(0, dtype=np.int64)
+        traces = np.zeros(0)
+
+        max_delta = 0
+        for step in range(1000):
+            obs_1, reward, done, _ = self.env.step(action_0)
+            self.metrics.episode_reward += reward
+            target = reward
+            if not done:
+                state_1, key_base_1 = self._encode(obs_1)
+                state_1_values = self.model.state_values(state_1)
+                action_1 = self.policy.choose_action_from_values(state_1_values)
+                value_1 = state_1_values[action_1]
+                target += self.gamma * value_1
+
+            # Mark the state-action pair taken as eligible
+            key_0 = key_base_0 + action_0
+            active = np.flatnonzero(trace_keys == key_0)
+            if len(active) > 0:
+                traces[active] = 1.0 if self.replacing_traces else traces[active] + 1.0
+            else:
+                trace_keys = np.append(trace_keys, key_0)
+                trace_states.append(state_0)
+                trace_actions = np.append(trace_actions, action_0)
+                traces = np.append(traces, 1.0)
+
+            action_value_deltas = self.alpha * (target - value_0) * traces
+            self.model.increment_action_values_batch(np.array(trace_states), trace_actions, action_value_deltas)
+            max_delta = max(max_delta, np.max(np.abs(action_value_deltas)))
+            if done:
+                break
+
+            # The update above also changed the value of the next state-action pair if it is eligible
+            value_0 = value_1 + np.sum(action_value_deltas[trace_keys == key_base_1 + action_1])
+
+            traces *= self.gamma * self.trace_decay
+            keep = traces >= self.trace_threshold
+            if not np.all(keep):
+                trace_keys, trace_actions, traces = trace_keys[keep], trace_actions[keep], traces[keep]
+                trace_states = [state for state, kept in zip(trace_states, keep) if kept]
+
+            state_0, key_base_0, action_0 = state_1, key_base_1, action_1
+
+        self.metrics.max_action_value_delta = max_delta
+        return self.metrics.episode_reward
+
+    def _encode(self, obs):
+        """
+        Return the representation of obs to pass to the model and the state-action key of its first action. Models
+        that accept state ids receive the state id, so the observation is encoded only once. For other models the
+        states are numbered by the bytes of their observation in the order they are first visited in the episode.
+        """
+        if self.model.accepts_state_ids:
+            state_id = envutil.to_state_id(obs, self._weights)
+            return state_id, state_id * self._action_count
+        state_key = self._state_keys.setdefault(obs.tobytes(), len(self._state_keys))
+        return obs, state_key * self._action_count
+
+
+class NStepSarsa:
+    """
+    n-step Sarsa: the value of each state-action pair is updated towards the rewards of the next n steps plus the
+    discounted value of the state-action pair n steps later. The next state is evaluated once and its values are used
+    both to choose the next action and to compute the targets.
+
+    :param n: The number of rewards included in each target
+    """
+
+    def __init__(self, env, model: Model, policy: EpsilonGreedyPolicy, n=4, alpha=0.01, gamma=0.9):
+        self.env = env
+        self.model = model
+        self.policy = policy
+        self.n = n
+        self.alpha = alpha
+        self.gamma = gamma
+        self.metrics = SarsaMetrics()
+        # Other models accept observations that may not fit into state ids
+        self._weights = envutil.obs_weights(env) if model.accepts_state_ids else None
+
+    def run_episode(self):
+        discounts = self.gamma ** np.arange(self.n)
+        state = self._encode(self.env.reset())
+        states = [state]
+        actions = [self.policy.choose_action_from_values(self.model.state_values(state))]
+        rewards = []
+        self.metrics.episode_reward = 0
+
+        max_delta = 0
+        for step in range(1000):
+            obs, reward, done, _ = self.env.step(actions[-1])
+            self.metrics.episode_reward += reward
+            rewards.append(reward)
+            if not done:
+                state = self._encode(obs)
+                state_values = self.model.state_values(state)
+                states.append(state)
+                actions.append(self.policy.choose_action_from_values(state_values))
+                next_value = state_values[actions[-1]]
+
+            # Update the pair n steps back, and once the episode has terminated all pairs that are left
+            first_updated = max(0, step - self.n + 1)
+            last_updated = step if done else step - self.n + 1
+            for tau in range(first_updated, last_updated + 1):
+                window = rewards[tau:tau + self.n]
+                n_step_return = np.dot(discounts[:len(window)], window)
+                if not done:
+                    n_step_return += self.gamma ** self.n * next_value
+                value = self.model.action_value(states[tau], actions[tau])
+                action_value_delta = self.alpha * (n_step_return - value)
+                self.model.update_action_value(states[tau], actions[tau], value + action_value_delta)
+                max_delta = max(max_delta, abs(action_value_delta))
+            if done:
+                break
+
+        self.metrics.max_action_value_delta = max_delta
+        return self.metrics.episode_reward
+
+    def _encode(self, obs):
+        """Return the representation of obs to pass to the model"""
+        return envutil.to_state_id(obs, self._weights) if self.model.accepts_state_ids else obs
+
+
+class VectorizedTD:
+    """
+    One-step temporal difference learning on a vectorized environment that steps num_envs environments in lockstep
+    and resets finished ones automatically (e.g. VecCleanBotEnv). Each tick chooses the actions of all environments
+    with one batched policy call and applies all updates with one batched model call.
+
+    The target of each update depends on the variant:
+        SARSA: the value of the action chosen in the next state
+        EXPECTED_SARSA: the expected value of the next state under the epsilon-greedy policy
+        Q_LEARNING: the largest value of the next state
+
+    run_episode() keeps ticking until an episode finishes and reports its reward and largest update through the same
+    metrics as Sarsa. Episodes that finish in the same tick are reported by subsequent calls.
+
+    :param env: A vectorized environment with attribute num_envs whose step() takes and returns batches
+    :param variant: One of SARSA, EXPECTED_SARSA or Q_LEARNING
+    """
+
+    SARSA = "sarsa"
+    EXPECTED_SARSA = "expected_sarsa"
+    Q_LEARNING = "q_learning"
+
+    def __init__(self, env, model: Model, policy: EpsilonGreedyPolicy, alpha=0.01, gamma=0.9, variant=SARSA):
+        assert variant in (self.SARSA, self.EXPECTED_SARSA, self.Q_LEARNING), f"Unknown variant {variant}"
+        self.env = env
+        self.model = model
+        self.policy = policy
+        self.alpha = alpha
+        self.gamma = gamma
+        self.variant = variant
+        self.metrics = SarsaMetrics()
+        # Other models accept observations that may not fit into state ids
+        self._weights = envutil.obs_weights(env) if model.accepts_state_ids else None
+
+        self._states = None
+        """Current state of each environment as passed to the model"""
+        self._actions = None
+        """Action chosen for the current state of each environment"""
+        self._episode_rewards = np.zeros(env.num_envs)
+        self._max_deltas = np.zeros(env.num_envs)
+        self._finished_episodes = deque()
+        """(episode reward, max action value delta) of finished episodes that have not been reported yet"""
+
+    def run_episode(self):
+        if self._states is None:
+            self._states = self._encode(self.env.reset())
+            self._actions = self.policy.choose_actions_from_values(self.model.state_values_batch(self._states))
+        while not self._finished_episodes:
+            self.tick()
+
+        self.metrics.episode_reward, self.metrics.max_action_value_delta = self._finished_episodes.popleft()
+        return self.metrics.episode_reward
+
+    def tick(self):
+        """Step all environments once and update the model"""
+        obs, rewards, dones, _ = self.env.step(self._actions)
+        next_states = self._encode(obs)
+        next_values = self.model.state_values_batch(next_states)
+        next_actions = self.policy.choose_actions_from_values(next_values)
+
+        if self.variant == self.SARSA:
+            next_value = next_values[np.arange(len(next_actions)), next_actions]
+        elif self.variant == self.Q_LEARNING:
+            next_value = np.amax(next_values, axis=1)
+        else:
+            exploration = getattr(self.policy, "exploration", 0.0)
+            next_value = (1 - exploration) * np.amax(next_values, axis=1) + exploration * np.mean(next_values, axis=1)
+        # Observations of finished environments already belong to the next episode and must not be bootstrapped from
+        targets = rewards + self.gamma * np.where(dones, 0.0, next_value)
+
+        action_value_deltas = self.alpha * (targets - self.model.action_values_batch(self._states, self._actions))
+        self.model.increment_action_values_batch(self._states, self._actions, action_value_deltas)
+
+        self._episode_rewards += rewards
+        np.maximum(self._max_deltas, np.abs(action_value_deltas), out=self._max_deltas)
+        for env_index in np.flatnonzero(dones):
+            self._finished_episodes.append((self._episode_rewards[env_index], self._max_deltas[env_index]))
+        self._episode_rewards[dones] = 0
+        self._max_deltas[dones] = 0
+
+        self._states, self._actions = next_states, next_actions
+
+    def _encode(self, observations):
+        """Return the representation of a batch of observations to pass to the model"""
+        return envutil.to_state_ids(observations, self._weights) if self.model.accepts_state_ids else observations
@@ -1,8 +1,17 @@
 import abc
+import numpy as np
 
 
 class Model:
-    """A model of the state-value function"""
+    """
+    A model of the state-value function
+
+    States are passed as observations of the environment. Table based models additionally accept the integer state ids
+    returned by Utilities.Env.to_state_id.
+    """
+
+    accepts_state_ids = False
+    """True if the model accepts integer state ids in place of observations"""
 
     @abc.abstractmethod
     def state_values(self, state):
@@ -19,6 +28,50 @@ class Model:
         """Update the value of a single state-action pair"""
         pass
 
+    def state_values_batch(self, states):
+        """
+        Get all action values for each state in states.
+
+        :param states: Array of observations, or for table based models an array of state ids
+        :returns: (len(states), number of actions) array
+        """
+        return np.array([self.state_values(state) for state in states])
+
+    def action_values_batch(self, states, actions):
+        """Get the value of each state-action pair given by states and actions."""
+        return np.array([self.action_value(state, action) for state, action in zip(states, actions)])
+
+    def update_action_values_batch(self, states, actions, new_values):
+        """
+        Update the values of a batch of state-action pairs. If a state-action pair occurs more than once, the last
+        value is kept.
+        """
+        for state, action, new_value in zip(states, actions, new_values):
+            self.update_action_value(state, action, new_value)
+
+    def increment_action_values_batch(self, states, actions, deltas):
+        """
+        Add deltas to the values of a batch of state-action pairs. If a state-action pair occurs more than once, all
+        of its deltas are added.
+        """
+        for state, action, delta in zip(states, actions, deltas):
+            self.update_action_value(state, action, self.action_value(state, action) + delta)
+
+    def greedy_action(self, state):
+        """
+        Return the action with the largest value for state if the model knows it without evaluating all action values
+        and it is unique. Otherwise return -1.
+        """
+        return -1
+
+    def greedy_actions_batch(self, states):
+        """Return greedy_action() for each state in states"""
+        return np.full(len(states), -1, dtype=np.int8)
+
+    def close(self):
+        """Release resources held by the model, like background threads. Does nothing by default."""
+        pass
+
     @abc.abstractmethod
     def save(self, file):
         """"
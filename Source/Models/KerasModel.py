@@ -3,8 +3,36 @@ from keras import backend as K
 
 from gym import Env, spaces
 import numpy as np
+from collections import OrderedDict
+from queue import Queue
+import os
+import tempfile
+import threading
+import time
 
 from Model import Model
+from Models.NumpyInference import NumpyForwardPass
+from Utilities.Replay import ReplayBuffer
+
+
+class AsyncTrainingMetrics:
+    def __init__(self):
+        self.submitted_batches = 0
+        """Number of batches handed to the background trainer"""
+
+        self.published_batches = 0
+        """Number of batches the network used for acting has been fitted to"""
+
+        self.max_staleness = 0
+        """Maximum number of submitted batches the network used for acting has not been fitted to yet"""
+
+        self.wait_time = 0.0
+        """Total time in seconds acting was blocked because the background trainer was busy"""
+
+    @property
+    def staleness(self):
+        """Number of submitted batches the network used for acting has not been fitted to yet"""
+        return self.submitted_batches - self.published_batches
 
 
 class KerasModel(Model):
@@ -12,14 +40,27 @@ class KerasModel(Model):
     An implementation of Model that approximates the action-value function using a neural network implemented with
     Keras. The Keras model used has to be provided on instantiation. The implementation does not update the keras model
     for every call to update_action_value(), but collects batch_size updated before the model is fitted to the new
-    observations
+    observations. Only the updated state-action values are collected; the values of the other actions are predicted for
+    the whole batch right before fitting.
 
     :param env: The environment
     :param model: A compiled keras model
     :param batch-size: The number of updates that are collected before the model is fitted to the new experience
+    :param cache_size: The maximum number of predictions of state_values() that are cached between two fittings of the
+        model. 0 disables the cache.
+    :param numpy_inference: Compute predictions with a NumPy copy of the network (see Models.NumpyInference) instead of
+        Keras. Ignored if the network contains layers the NumPy implementation does not support.
+    :param replay_buffer: If given, updates are stored in the replay buffer and the model is fitted on minibatches
+        sampled from it instead of fitting batch_size fresh updates for a number of epochs.
+    :param minibatch_size: The number of updates sampled from the replay buffer for each fitting step
+    :param train_frequency: The number of updates after which the model is fitted on a minibatch from the replay buffer
+    :param async_training: Fit the model on a background thread. Acting keeps using the NumPy copy of the network
+        fitted last, which is replaced as a whole when the next fit finishes. A new batch can be collected while the
+        previous one is fitted. Requires numpy_inference and a network it supports, and no replay buffer.
     """
 
-    def __init__(self, env: Env, model: keras.Model, batch_size=128):
+    def __init__(self, env: Env, model: keras.Model, batch_size=128, cache_size=4096, numpy_inference=True,
+                 replay_buffer: ReplayBuffer = None, minibatch_size=32, train_frequency=1, async_training=False):
         assert isinstance(env.observation_space, spaces.Box), "Unsupported observation space"
         assert np.count_nonzero(env.observation_space.low) == 0, "Unsupported observation space"
         assert isinstance(env.action_space, spaces.Discrete), "Unsupported action space"
@@ -40,50 +81,274 @@ class KerasModel(Model):
         """observations used as input during model fitting"""
         self._y_train = np.zeros((self.batch_size,) + (env.action_space.n,))
         """action values used as expectation during model fitting"""
+        self._actions = np.zeros(self.batch_size, dtype=np.int32)
+        """actions whose values have been updated"""
+        self._targets = np.zeros(self.batch_size)
+        """updated values of the actions in _actions"""
         self._input_normalizer = 1.0 / env.observation_space.high
 
+        self.cache_size = cache_size
+        """The maximum number of predictions of state_values() that are cached between two fittings of the model"""
+        self.cache_hits = 0
+        """The number of calls to state_values() answered from the cache"""
+        self.cache_misses = 0
+        """The number of calls to state_values() that required a prediction"""
+        self._cache = OrderedDict()
+        """Least recently used predictions, keyed by the bytes of the observation"""
+        self._cache_key_dtype = np.uint8 if np.max(env.observation_space.high) <= 255 else np.float32
+        self._cache_version = 0
+        """Value of _weights_version the cached predictions were made with"""
+        self._weights_version = 0
+        """Incremented whenever the network used for predictions changes"""
+
+        self.replay_buffer = replay_buffer
+        """Replay buffer the model is fitted from, or None to fit on batches of fresh updates"""
+        self.minibatch_size = minibatch_size
+        """The number of updates sampled from the replay buffer for each fitting step"""
+        self.train_frequency = train_frequency
+        """The number of updates after which the model is fitted on a minibatch from the replay buffer"""
+        self._updates_since_replay = 0
+
+        self._inference = None
+        """NumPy copy of the network used for predictions, or None to predict with Keras"""
+        if numpy_inference:
+            try:
+                self._inference = NumpyForwardPass(model)
+            except ValueError:
+                pass
+
+        self.async_metrics = AsyncTrainingMetrics()
+        """Metrics of the background trainer, if async_training is enabled"""
+        self._training_queue = None
+        self._training_thread = None
+        self._training_error = None
+        if async_training:
+            assert self._inference is not None, "Asynchronous training requires a network supported by NumpyInference"
+            assert replay_buffer is None, "Asynchronous training does not support replay buffers"
+            self._start_training_thread()
+
     def update_action_value(self, state, action, observed_reward):
-        # Evaluate the model to retrieve the current action value estimation and update the actual
-        # value of the action taken
-        updated_state_values = self.state_values(state)
-        updated_state_values[action] = observed_reward
+        if self.replay_buffer is not None:
+            self.replay_buffer.add(state, action, observed_reward)
+            self._updates_since_replay += 1
+            if self._updates_since_replay >= self.train_frequency and len(self.replay_buffer) >= self.minibatch_size:
+                self.train_on_replay()
+                self._updates_since_replay = 0
+            return
 
-        # Store observation and action value for model fitting
+        # Only record the update. The values of the actions not taken are predicted for the whole batch right before
+        # the model is fitted. Since the network only changes when it is fitted, this gives the same values as
+        # predicting them here.
         self._x_train[self._collected_count] = state
-        self._y_train[self._collected_count] = updated_state_values
+        self._actions[self._collected_count] = action
+        self._targets[self._collected_count] = observed_reward
         self._collected_count += 1
         if self._collected_count == self.batch_size:
             # If batch_size updates have been collected fit the model and clear the buffer
             self.train()
             self._collected_count = 0
 
+    def update_action_values_batch(self, states, actions, observed_rewards):
+        for state, action, observed_reward in zip(states, actions, observed_rewards):
+            self.update_action_value(state, action, observed_reward)
+
+    def increment_action_values_batch(self, states, actions, deltas):
+        states = np.asarray(states)
+        # State-action pairs that occur more than once receive the sum of their deltas
+        state_action_pairs = np.column_stack((states.reshape(len(states), -1), actions))
+        _, pair_index = np.unique(state_action_pairs, axis=0, return_inverse=True)
+        pair_index = pair_index.ravel()
+        summed_deltas = np.bincount(pair_index, weights=deltas)[pair_index]
+        self.update_action_values_batch(states, actions, self.action_values_batch(states, actions) + summed_deltas)
+
     def train(self):
+        """Fit the model to the collected updates, or hand them to the background trainer if async_training is set"""
+        if self._training_queue is None:
+            self._fit(self._x_train, self._actions, self._targets)
+            self._weights_changed()
+            return
+
+        self._raise_training_error()
+        start = time.perf_counter()
+        # The buffers are refilled while the background trainer fits the copies
+        self._training_queue.put((self._x_train.copy(), self._actions.copy(), self._targets.copy()))
+        self.async_metrics.wait_time += time.perf_counter() - start
+        self.async_metrics.submitted_batches += 1
+        self.async_metrics.max_staleness = max(self.async_metrics.max_staleness, self.async_metrics.staleness)
+
+    def wait_for_training(self):
+        """Block until the background trainer has fitted and published all submitted batches"""
+        if self._training_queue is not None:
+            start = time.perf_counter()
+            self._training_queue.join()
+            self.async_metrics.wait_time += time.perf_counter() - start
+            self._raise_training_error()
+
+    def close(self):
+        """
+        Stop the background trainer after it has fitted all submitted batches and raise the error of any batch it
+        failed to fit. The model can still be used afterwards and fits synchronously.
+        """
+        if self._training_queue is not None:
+            # The trainer stops when it receives None
+            self._training_queue.put(None)
+            self._training_thread.join()
+            self._training_queue = None
+            self._training_thread = None
+            self._raise_training_error()
+
+    def _start_training_thread(self):
+        # Holds at most one batch waiting to be fitted while another one is fitted
+        self._training_queue = Queue(maxsize=1)
+        self._training_thread = threading.Thread(target=self._training_loop, daemon=True)
+        self._training_thread.start()
+
+    def __getstate__(self):
+        """
+        Pickle the network as the contents of an HDF5 file, which includes the state of the optimizer. Cached
+        predictions are dropped and the background trainer is restarted when unpickled.
+        """
+        self.wait_for_training()
+        state = self.__dict__.copy()
+        with tempfile.TemporaryDirectory() as directory:
+            file = os.path.join(directory, "model.h5")
+            self.model.save(file)
+            with open(file, "rb") as f:
+                state["model"] = f.read()
+        state["_cache"] = OrderedDict()
+        state["_inference"] = self._inference is not None
+        state["_training_queue"] = self._training_queue is not None
+        state["_training_thread"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        with tempfile.TemporaryDirectory() as directory:
+            file = os.path.join(directory, "model.h5")
+            with open(file, "wb") as f:
+                f.write(state["model"])
+            self.model = keras.models.load_model(file)
+        self._inference = NumpyForwardPass(self.model) if state["_inference"] else None
+        self._training_queue = None
+        if state["_training_queue"]:
+            self._start_training_thread()
+
+    def _fit(self, x_train, actions, targets):
+        """Fit the model to a batch of updates. Normalizes x_train in place."""
         # Normalize the input values.
-        self._x_train *= self._input_normalizer
+        x_train *= self._input_normalizer
+        x_train = self._to_model_input(x_train)
 
-        # Reshape to match the image format of the backend used
-        if K.image_data_format() == 'channels_first':
-            x_train = self._x_train.reshape((self._x_train.shape[0], 1, self._rows_count, self._col_count,))
-        else:
-            x_train = self._x_train.reshape((self._x_train.shape[0], self._rows_count, self._col_count, 1,))
+        # Use the current predictions as targets of the actions that were not taken, all in a single prediction
+        self._y_train[:] = self._predict(x_train)
+        self._y_train[np.arange(self.batch_size), actions] = targets
 
         self.model.fit(x_train, self._y_train,
                        batch_size=self.batch_size,
                        epochs=self.epochs,
                        verbose=0)
 
+    def _training_loop(self):
+        """Body of the background trainer thread"""
+        while True:
+            batch = self._training_queue.get()
+            if batch is None:
+                self._training_queue.task_done()
+                return
+            x_train, actions, targets = batch
+            try:
+                self._fit(x_train, actions, targets)
+                # Replacing the reference publishes the new weights atomically. Predictions in progress finish with
+                # the previous copy.
+                self._inference = NumpyForwardPass(self.model)
+                self._weights_version += 1
+                self.async_metrics.published_batches += 1
+            except Exception as error:
+                self._training_error = error
+            finally:
+                self._training_queue.task_done()
+
+    def _raise_training_error(self):
+        if self._training_error is not None:
+            error, self._training_error = self._training_error, None
+            raise error
+
+    def train_on_replay(self):
+        """Fit the model on a single minibatch sampled from the replay buffer"""
+        indices, weights = self.replay_buffer.sample(self.minibatch_size)
+        x_train = self._to_model_input(self.replay_buffer.obs[indices] * self._input_normalizer)
+        targets = self.replay_buffer.targets[indices]
+        rows = np.arange(len(indices))
+
+        # Use the current predictions as targets of the actions that were not taken
+        y_train = self._predict(x_train)
+        errors = targets - y_train[rows, self.replay_buffer.actions[indices]]
+        y_train[rows, self.replay_buffer.actions[indices]] = targets
+
+        self.model.train_on_batch(x_train, y_train, sample_weight=weights)
+        self.replay_buffer.update_priorities(indices, errors)
+        self._weights_changed()
+
+    def _weights_changed(self):
+        """Bring the NumPy copy of the network up to date and invalidate the cached predictions after fitting"""
+        if self._inference is not None:
+            self._inference.load_weights(self.model)
+        self._weights_version += 1
+
+    @property
+    def cache_hit_rate(self):
+        """The fraction of calls to state_values() that were answered from the cache"""
+        total = self.cache_hits + self.cache_misses
+        return self.cache_hits / total if total else 0.0
+
     def state_values(self, state):
+        if self._cache_version != self._weights_version:
+            self._cache.clear()
+            self._cache_version = self._weights_version
+        key = np.ascontiguousarray(state, dtype=self._cache_key_dtype).tobytes()
+        state_values = self._cache.get(key)
+        if state_values is not None:
+            self.cache_hits += 1
+            self._cache.move_to_end(key)
+            return state_values.copy()
+
+        self.cache_misses += 1
         # Normalize the input values.
         normalized_state = state * self._input_normalizer
-        # Add batch size of 1 to front, and 1 channel to back of the state shape
-        shape = (1, ) + state.shape + (1, )
-        # Predict and extract prediction for batch 0
-        return self.model.predict(normalized_state.reshape(shape))[0]
+        # Predict a batch of size 1 and extract prediction for batch 0
+        state_values = self._predict(self._to_model_input(normalized_state[np.newaxis]))[0]
+        if self.cache_size > 0:
+            self._cache[key] = state_values
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return state_values.copy()
 
     def action_value(self, state, action):
         return self.state_values(state)[action]
 
+    def state_values_batch(self, states):
+        normalized_states = np.asarray(states) * self._input_normalizer
+        return self._predict(self._to_model_input(normalized_states))
+
+    def action_values_batch(self, states, actions):
+        return self.state_values_batch(states)[np.arange(len(states)), actions]
+
+    def _predict(self, model_input):
+        """Predict the action values of a batch of model inputs"""
+        inference = self._inference
+        if inference is not None:
+            return inference.predict(model_input)
+        return self.model.predict(model_input, verbose=0)
+
+    def _to_model_input(self, normalized_states):
+        """Reshape a batch of normalized observations to match the image format of the backend used"""
+        if K.image_data_format() == 'channels_first':
+            return normalized_states.reshape((len(normalized_states), 1, self._rows_count, self._col_count,))
+        else:
+            return normalized_states.reshape((len(normalized_states), self._rows_count, self._col_count, 1,))
+
     def save(self, name):
+        self.wait_for_training()
         if not name[:-3] == ".h5":
             name = name+".h5"
         self.model.save(name)
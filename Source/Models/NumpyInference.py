@@ -0,0 +1,194 @@
+"""
+Models.NumpyInference
+=====================
+
+Evaluates small Sequential Keras models with NumPy. For the tiny networks used to approximate action values, a Keras
+predict call is dominated by framework overhead, which this forward pass avoids. Supported layers are Conv2D, Dense,
+Flatten, MaxPooling2D, Dropout, Activation and InputLayer.
+"""
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+import keras
+
+
+_ACTIVATIONS = {
+    "linear": lambda x: x,
+    "relu": lambda x: np.maximum(x, 0),
+    "sigmoid": lambda x: 1 / (1 + np.exp(-x)),
+    "tanh": np.tanh,
+    "softmax": lambda x: _softmax(x),
+}
+
+
+def _softmax(x):
+    exp = np.exp(x - np.max(x, axis=-1, keepdims=True))
+    return exp / np.sum(exp, axis=-1, keepdims=True)
+
+
+def _activation(name):
+    if name not in _ACTIVATIONS:
+        raise ValueError(f"Unsupported activation: {name}")
+    return _ACTIVATIONS[name]
+
+
+def _same_padding(size, kernel_size, stride):
+    """Return the padding before and after a spatial axis that Keras applies for padding='same'"""
+    output_size = -(-size // stride)
+    total = max((output_size - 1) * stride + kernel_size - size, 0)
+    return total // 2, total - total // 2
+
+
+def _sliding_windows(x, window, strides, padding, pad_value):
+    """
+    Return a view of all windows of the spatial axes of the (batch, height, width, channels) array x with shape
+    (batch, output height, output width, channels, window height, window width)
+    """
+    if padding == "same":
+        pad_y = _same_padding(x.shape[1], window[0], strides[0])
+        pad_x = _same_padding(x.shape[2], window[1], strides[1])
+        x = np.pad(x, ((0, 0), pad_y, pad_x, (0, 0)), constant_values=pad_value)
+    elif padding != "valid":
+        raise ValueError(f"Unsupported padding: {padding}")
+    return sliding_window_view(x, window, axis=(1, 2))[:, ::strides[0], ::strides[1]]
+
+
+class _Conv2D:
+    def __init__(self, config):
+        if tuple(config["dilation_rate"]) != (1, 1) or config.get("groups", 1) != 1:
+            raise ValueError("Dilated and grouped convolutions are not supported")
+        self.kernel_size = tuple(config["kernel_size"])
+        self.strides = tuple(config["strides"])
+        self.padding = config["padding"]
+        self.use_bias = config["use_bias"]
+        self.activation = _activation(config["activation"])
+        self.kernel = None
+        self.bias = 0
+
+    def load_weights(self, weights):
+        kernel = weights[0]
+        # Order the kernel like the flattened windows: (channels, window height, window width) -> filters
+        self.kernel = np.ascontiguousarray(kernel.transpose(2, 0, 1, 3).reshape(-1, kernel.shape[3]))
+        if self.use_bias:
+            self.bias = weights[1]
+
+    def forward(self, x):
+        # im2col: every output pixel becomes a row holding its receptive field, so the convolution of the whole batch
+        # is a single matrix multiplication
+        windows = _sliding_windows(x, self.kernel_size, self.strides, self.padding, 0)
+        batch, height, width = windows.shape[:3]
+        columns = windows.reshape(batch * height * width, -1)
+        return self.activation(columns @ self.kernel + self.bias).reshape(batch, height, width, -1)
+
+
+class _MaxPooling2D:
+    def __init__(self, config):
+        self.pool_size = tuple(config["pool_size"])
+        self.strides = tuple(config["strides"] or config["pool_size"])
+        self.padding = config["padding"]
+
+    def load_weights(self, weights):
+        pass
+
+    def forward(self, x):
+        return _sliding_windows(x, self.pool_size, self.strides, self.padding, -np.inf).max(axis=(4, 5))
+
+
+class _Flatten:
+    def __init__(self, config):
+        self.channels_first = config.get("data_format") == "channels_first"
+
+    def load_weights(self, weights):
+        pass
+
+    def forward(self, x):
+        if self.channels_first and x.ndim == 4:
+            x = x.transpose(0, 3, 1, 2)
+        return x.reshape(len(x), -1)
+
+
+class _Dense:
+    def __init__(self, config):
+        self.use_bias = config["use_bias"]
+        self.activation = _activation(config["activation"])
+        self.kernel = None
+        self.bias = 0
+
+    def load_weights(self, weights):
+        self.kernel = weights[0]
+        if self.use_bias:
+            self.bias = weights[1]
+
+    def forward(self, x):
+        return self.activation(x @ self.kernel + self.bias)
+
+
+class _Activation:
+    def __init__(self, config):
+        self.activation = _activation(config["activation"])
+
+    def load_weights(self, weights):
+        pass
+
+    def forward(self, x):
+        return self.activation(x)
+
+
+class _Identity:
+    def __init__(self, config):
+        pass
+
+    def load_weights(self, weights):
+        pass
+
+    def forward(self, x):
+        return x
+
+
+_LAYERS = {
+    "Conv2D": _Conv2D,
+    "MaxPooling2D": _MaxPooling2D,
+    "Flatten": _Flatten,
+    "Dense": _Dense,
+    "Activation": _Activation,
+    # Dropout is only active during training
+    "Dropout": _Identity,
+    "InputLayer": _Identity,
+}
+
+
+class NumpyForwardPass:
+    """
+    A NumPy copy of a Sequential Keras model that computes the same predictions. The weights are copied on creation
+    and have to be copied again with load_weights() whenever the Keras model has been fitted.
+
+    :param model: A Sequential Keras model consisting only of supported layers
+    :raises ValueError: if the model contains a layer or option that is not supported
+    """
+
+    def __init__(self, model: keras.Model):
+        self.layers = []
+        for layer in model.layers:
+            layer_type = type(layer).__name__
+            if layer_type not in _LAYERS:
+                raise ValueError(f"Unsupported layer: {layer_type}")
+            self.layers.append(_LAYERS[layer_type](layer.get_config()))
+
+        # Computations are done in channels last format. Channels first inputs are transposed on entry.
+        self._channels_first = any(layer.get_config().get("data_format") == "channels_first"
+                                   for layer in model.layers)
+        self.load_weights(model)
+
+    def load_weights(self, model: keras.Model):
+        """Copy the current weights of model, which must be the model this instance was created from"""
+        for layer, keras_layer in zip(self.layers, model.layers):
+            layer.load_weights([np.asarray(weights, dtype=np.float32) for weights in keras_layer.get_weights()])
+
+    def predict(self, x):
+        """Return the predictions for the batch x, which has the same shape as the input of the Keras model"""
+        x = np.asarray(x, dtype=np.float32)
+        if self._channels_first and x.ndim == 4:
+            x = x.transpose(0, 2, 3, 1)
+        for layer in self.layers:
+            x = layer.forward(x)
+        return x
@@ -0,0 +1,57 @@
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from Models.TableModel import TableModel
+
+
+class SharedTableModel(TableModel):
+    """
+    A TableModel whose arrays are stored in shared memory, so worker processes can read and update the same table
+    without copying it. Forked processes inherit the shared table. Pickling a SharedTableModel only transfers the names
+    of the shared memory blocks and the unpickled copy attaches to them, so it can also be passed to spawned processes.
+
+    The process that created the table owns the shared memory and must call close() when done, which releases it.
+
+    :param env: The environment
+    """
+
+    def __init__(self, env):
+        self._memory = []
+        self._owner = True
+        super().__init__(env)
+
+    def close(self):
+        """Detach from the shared memory. When called by the owner, the shared memory is released."""
+        self.value_function = None
+        self.greedy_actions = None
+        for memory in self._memory:
+            memory.close()
+            if self._owner:
+                memory.unlink()
+        self._memory = []
+
+    def _allocate(self, shape, dtype, fill_value):
+        array = self._attach(shared_memory.SharedMemory(create=True, size=max(1, int(np.prod(shape)) *
+                                                                               np.dtype(dtype).itemsize)),
+                             shape, dtype)
+        array.fill(fill_value)
+        return array
+
+    def _attach(self, memory, shape, dtype):
+        self._memory.append(memory)
+        return np.ndarray(shape, dtype=dtype, buffer=memory.buf)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["value_function"], state["greedy_actions"], state["_memory"]
+        state["_owner"] = False
+        state["_memory_names"] = [memory.name for memory in self._memory]
+        return state
+
+    def __setstate__(self, state):
+        value_name, greedy_name = state.pop("_memory_names")
+        self.__dict__.update(state)
+        self._memory = []
+        self.value_function = self._attach(shared_memory.SharedMemory(name=value_name), self.shape, np.float32)
+        self.greedy_actions = self._attach(shared_memory.SharedMemory(name=greedy_name), self.shape[0], np.int8)
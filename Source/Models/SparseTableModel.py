@@ -0,0 +1,90 @@
+import numpy as np
+from Model import Model
+
+from Utilities import Env
+
+
+class SparseTableModel(Model):
+    """
+    A table model that only stores the action values of states that have been updated. Observations are encoded into
+    integer state ids that serve as keys of an open-addressing hash table with linear probing. Keys and action values
+    are kept in two parallel arrays that double in size when the table gets half full, so memory grows with the number
+    of visited states instead of the size of the state space. All methods also accept state ids (see
+    Utilities.Env.to_state_id) instead of observations.
+
+    :param env: The environment
+    :param default_value: The value of all actions of states that have never been updated
+    :param initial_capacity: The number of states that can be stored before the table is grown the first time
+    """
+
+    _EMPTY = -1
+    _GOLDEN_RATIO_64 = 0x9E3779B97F4A7C15
+    _MASK_64 = 0xFFFFFFFFFFFFFFFF
+
+    accepts_state_ids = True
+
+    def __init__(self, env, default_value=0.0, initial_capacity=1024):
+        self.env = env
+        self.default_value = default_value
+        """The value of all actions of states that have never been updated"""
+        self.state_count = 0
+        """The number of states stored in the table"""
+
+        self._weights = Env.obs_weights(env)
+        self._action_count = env.action_space.n
+        self._allocate(max(2, 1 << int(np.ceil(np.log2(2 * initial_capacity)))))
+
+    def state_values(self, state):
+        slot = self._find_slot(int(Env.to_state_id(state, self._weights)))
+        if self._keys[slot] == self._EMPTY:
+            return np.full(self._action_count, self.default_value, dtype=np.float32)
+        return self._values[slot]
+
+    def action_value(self, state, action):
+        """Get all action values for state."""
+        return self.state_values(state)[action]
+
+    def update_action_value(self, state, action, value):
+        """Update a state-action value"""
+        key = int(Env.to_state_id(state, self._weights))
+        slot = self._find_slot(key)
+        if self._keys[slot] == self._EMPTY:
+            if 2 * (self.state_count + 1) > len(self._keys):
+                self._grow()
+                slot = self._find_slot(key)
+            self._keys[slot] = key
+            self.state_count += 1
+        self._values[slot, action] = value
+
+    def save(self, file):
+        occupied = self._keys != self._EMPTY
+        np.savez(file, keys=self._keys[occupied], values=self._values[occupied],
+                 default_value=self.default_value)
+
+    def _allocate(self, capacity):
+        """Allocate empty key and value arrays for capacity slots. capacity must be a power of two."""
+        self._keys = np.full(capacity, self._EMPTY, dtype=np.int64)
+        self._values = np.full((capacity, self._action_count), self.default_value, dtype=np.float32)
+        self._slot_mask = capacity - 1
+        self._hash_shift = 64 - (capacity.bit_length() - 1)
+
+    def _find_slot(self, key):
+        """Return the slot holding key or, if key is not in the table, the empty slot it would be inserted into"""
+        # Fibonacci hashing spreads the dense, highly structured state ids across the table
+        slot = ((key * self._GOLDEN_RATIO_64) & self._MASK_64) >> self._hash_shift
+        keys = self._keys
+        while True:
+            slot_key = keys[slot]
+            if slot_key == key or slot_key == self._EMPTY:
+                return slot
+            slot = (slot + 1) & self._slot_mask
+
+    def _grow(self):
+        """Double the capacity of the table and re-insert all stored states"""
+        occupied = self._keys != self._EMPTY
+        keys, values = self._keys[occupied], self._values[occupied]
+        self._allocate(2 * len(self._keys))
+        for key, row in zip(keys.tolist(), values):
+            slot = self._find_slot(key)
+            self._keys[slot] = key
+            self._values[slot] = row
@@ -1,36 +1,88 @@
 import numpy as np
 from Model import Model
-from Utilities.Env import to_table_index
 
 from Utilities import Env
 
 
 class TableModel(Model):
+    """
+    Stores the value of every state-action pair in a (num_states, num_actions) array. Observations are mapped to a row
+    by encoding them into an integer state id, which is a single dot product with precomputed place values. All methods
+    also accept state ids (see Utilities.Env.to_state_id) instead of observations, so hot loops can encode each
+    observation once.
+
+    The greedy action of every state is maintained incrementally for the rows that are updated, so a greedy policy
+    can look it up instead of searching the maximum of the row.
+    """
+
+    accepts_state_ids = True
 
     def __init__(self, env):
         self.env = env
-        self.shape = Env.obs_action_shape(env)
-        self.value_function = np.zeros(self.shape, dtype=np.float32)
+        self.state_weights = Env.obs_weights(env)
+        """Place values that encode observations into state ids"""
+        self.shape = (Env.state_count(env), env.action_space.n)
+        self.value_function = self._allocate(self.shape, np.float32, 0)
+        assert env.action_space.n <= np.iinfo(np.int8).max, "Too many actions"
+        self.greedy_actions = self._allocate(self.shape[0], np.int8, -1)
+        """
+        The action with the largest value of each state, or -1 if several actions share the largest value. Initially
+        all actions of all states have the same value. Only the update methods of the model keep it up to date. Writing
+        to value_function directly leaves the greedy actions of the changed states stale.
+        """
 
     def state_values(self, state):
-        return self.value_function[to_table_index(state)]
+        return self.value_function[Env.to_state_id(state, self.state_weights)]
 
     def action_value(self, state, action):
         """Get all action values for state."""
-        return self.value_function[to_table_index(state, action)]
+        return self.value_function[Env.to_state_id(state, self.state_weights), action]
 
     def update_action_value(self, state, action, value):
         """Update a state-action value"""
-        self.value_function[to_table_index(state, action)] = value
+        state_id = Env.to_state_id(state, self.state_weights)
+        self.value_function[state_id, action] = value
+        self._update_greedy_actions(state_id)
+
+    def greedy_action(self, state):
+        return self.greedy_actions[Env.to_state_id(state, self.state_weights)]
+
+    def greedy_actions_batch(self, states):
+        return self.greedy_actions[Env.to_state_ids(states, self.state_weights)]
+
+    def export_greedy_policy(self):
+        """
+        Return the greedy action of every state as an int8 array indexed by state id. Ties are resolved in favour of
+        the action with the lowest index.
+        """
+        return np.argmax(self.value_function, axis=1).astype(np.int8)
+
+    def state_values_batch(self, states):
+        return self.value_function[Env.to_state_ids(states, self.state_weights)]
+
+    def action_values_batch(self, states, actions):
+        return self.value_function[Env.to_state_ids(states, self.state_weights), actions]
+
+    def update_action_values_batch(self, states, actions, values):
+        state_ids = Env.to_state_ids(states, self.state_weights)
+        self.value_function[state_ids, actions] = values
+        self._update_greedy_actions(state_ids)
+
+    def increment_action_values_batch(self, states, actions, deltas):
+        state_ids = Env.to_state_ids(states, self.state_weights)
+        np.add.at(self.value_function, (state_ids, actions), deltas)
+        self._update_greedy_actions(state_ids)
+
+    def _update_greedy_actions(self, state_ids):
+        """Recompute the greedy action of the given state or states"""
+        rows = self.value_function[state_ids]
+        is_maximum = rows == np.amax(rows, axis=-1, keepdims=True)
+        self.greedy_actions[state_ids] = np.where(np.count_nonzero(is_maximum, axis=-1) == 1,
+                                                  np.argmax(is_maximum, axis=-1), -1)
 
     def save(self, file):
         np.save(file, self.value_function, allow_pickle=False)
 
-
-
-
-
-
-
-
-
+    def _allocate(self, shape, dtype, fill_value):
+        """Allocate one of the arrays of the table, filled with fill_value"""
+        return np.full(shape, fill_value, dtype=dtype)
@@ -16,6 +16,15 @@ class Policy:
         """
         pass
 
+    def choose_actions(self, observations):
+        """
+        Choose an action for each observation of a batch, e.g. the observations of a vectorized environment
+
+        :returns:
+            Array of the chosen actions
+        """
+        return np.array([self.choose_action(observation) for observation in observations])
+
 
 class GreedyPolicy(Policy):
     """
@@ -30,12 +39,34 @@ class GreedyPolicy(Policy):
         self.model = model
 
     def choose_action(self, state):
-        action_values = self.model.state_values(state)
+        action = self.model.greedy_action(state)
+        if action >= 0:
+            return action
+        return GreedyPolicy.choose_action_from_values(self, self.model.state_values(state))
+
+    def choose_action_from_values(self, action_values):
+        """Choose an action given the action values of the current state, which the caller has already evaluated"""
         # If multiple actions have the same value, chose one at random
         maximums = np.argwhere(action_values == np.amax(action_values)).flatten()
         action = maximums[np.random.randint(0, len(maximums))]
         return action
 
+    def choose_actions(self, states):
+        actions = self.model.greedy_actions_batch(states).astype(np.int64)
+        unknown = actions < 0
+        if np.any(unknown):
+            action_values = self.model.state_values_batch(np.asarray(states)[unknown])
+            actions[unknown] = GreedyPolicy.choose_actions_from_values(self, action_values)
+        return actions
+
+    def choose_actions_from_values(self, action_values):
+        """Choose an action for each row of a (batch size, number of actions) array of action values"""
+        # Draw a random number for each action and pick the action with the largest draw among the maximums. This
+        # breaks ties uniformly at random for all states at once.
+        draws = np.random.random_sample(action_values.shape)
+        draws[action_values != np.amax(action_values, axis=1, keepdims=True)] = -1
+        return np.argmax(draws, axis=1)
+
 
 class EpsilonGreedyPolicy(GreedyPolicy):
     """
@@ -52,3 +83,21 @@ class EpsilonGreedyPolicy(GreedyPolicy):
             return action
         else:
             return super().choose_action(observation)
+
+    def choose_action_from_values(self, action_values):
+        if np.random.random_sample() < self.exploration:
+            return np.random.randint(0, len(action_values))
+        else:
+            return super().choose_action_from_values(action_values)
+
+    def choose_actions(self, observations):
+        return self._explore(super().choose_actions(observations), self.model.env.action_space.n)
+
+    def choose_actions_from_values(self, action_values):
+        return self._explore(super().choose_actions_from_values(action_values), action_values.shape[1])
+
+    def _explore(self, actions, action_count):
+        """Replace each of the greedy actions by a random action with a probability of exploration"""
+        explore = np.random.random_sample(len(actions)) < self.exploration
+        actions[explore] = np.random.randint(0, action_count, size=np.count_nonzero(explore))
+        return actions
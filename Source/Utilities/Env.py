@@ -6,34 +6,130 @@ Utility functions for dealing with environments
 """
 
 from gym import Env
-from typing import List, Tuple, Any, ValuesView
+from typing import List, Tuple
 from Policies import Policy
 import numpy as np
 
 
-class Interaction:
-    """Represent a single interaction with the environment"""
-    def __init__(self, obs, action, ret):
-        self.obs = obs
-        self.action = action
-        self.reward = ret
+class EpisodeBuffer:
+    """
+    Columnar record of the interactions of a single episode. Observations, actions, rewards and done flags are stored in
+    contiguous preallocated arrays that are reused for every recorded episode, so recording does not allocate an object
+    per step. The arrays grow when an episode is longer than the current capacity.
+
+    :param env: The environment the episodes are recorded from
+    :param capacity: The initial number of steps that can be stored. Defaults to env.max_steps if the environment
+        defines it.
+    """
+    def __init__(self, env: Env, capacity=None):
+        assert np.max(env.observation_space.high) <= np.iinfo(np.uint8).max, "Unsupported observation space"
+        if capacity is None:
+            capacity = getattr(env, "max_steps", 1024)
+
+        self.length = 0
+        """The number of interactions recorded in the current episode"""
+        self.state_weights = obs_weights(env) if can_encode_state_ids(env) else None
+        """
+        Place values that encode observations into integer state ids, or None if the observations of env do not fit
+        into 64 bit integers. See obs_weights.
+        """
+        self.action_count = env.action_space.n
+        """The number of actions of the environment"""
+
+        self._obs = np.zeros((capacity, ) + env.observation_space.shape, dtype=np.uint8)
+        self._actions = np.zeros(capacity, dtype=np.int32)
+        self._rewards = np.zeros(capacity, dtype=np.float64)
+        self._done = np.zeros(capacity, dtype=bool)
+
+    @property
+    def obs(self):
+        """(length, ...) array of the observations the actions were chosen on"""
+        return self._obs[:self.length]
+
+    @property
+    def actions(self):
+        """(length, ) array of the actions taken"""
+        return self._actions[:self.length]
+
+    @property
+    def rewards(self):
+        """(length, ) array of the rewards received for the actions taken"""
+        return self._rewards[:self.length]
+
+    @property
+    def done(self):
+        """(length, ) array that is True for the step that ended the episode"""
+        return self._done[:self.length]
+
+    def __len__(self):
+        return self.length
 
+    def state_ids(self):
+        """(length, ) array of the integer state ids of the recorded observations. Requires state_weights."""
+        assert self.state_weights is not None, "Observation space too large to encode into a 64 bit integer"
+        return self.obs.reshape(self.length, -1) @ self.state_weights
 
-def record_episode(env: Env, policy: Policy, max_steps=10000) -> List[Interaction]:
+    def state_action_keys(self):
+        """
+        (length, ) array of integer keys that uniquely identify the state-action pairs taken. Requires state_weights.
+        """
+        return self.state_ids() * self.action_count + self.actions
+
+    def clear(self):
+        """Discard the recorded interactions, but keep the allocated arrays"""
+        self.length = 0
+
+    def append(self, obs, action, reward, done):
+        """Record a single interaction with the environment"""
+        if self.length == len(self._actions):
+            self._grow()
+        index = self.length
+        self._obs[index] = obs
+        self._actions[index] = action
+        self._rewards[index] = reward
+        self._done[index] = done
+        self.length += 1
+
+    def extend(self, obs, actions, rewards, done):
+        """Record a sequence of interactions given as arrays with one entry per step"""
+        end = self.length + len(actions)
+        while end > len(self._actions):
+            self._grow()
+        self._obs[self.length:end] = obs
+        self._actions[self.length:end] = actions
+        self._rewards[self.length:end] = rewards
+        self._done[self.length:end] = done
+        self.length = end
+
+    def _grow(self):
+        """Double the capacity of all arrays"""
+        capacity = 2 * len(self._actions)
+        for name in ("_obs", "_actions", "_rewards", "_done"):
+            old = getattr(self, name)
+            new = np.zeros((capacity, ) + old.shape[1:], dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+
+def record_episode(env: Env, policy: Policy, max_steps=10000, episode: EpisodeBuffer = None) -> EpisodeBuffer:
     """
     Record a sequence of interactions with the environment until the episode terminates or a maximum number of
     steps is reached.
 
+    :param episode: Buffer to record the episode into. Its previous content is discarded. A new buffer is allocated if
+        not given.
     :returns:
-        The sequence of interactions as a List[:class Interaction:].
+        The sequence of interactions as a :class EpisodeBuffer:.
     """
-    episode = []
+    if episode is None:
+        episode = EpisodeBuffer(env)
+    episode.clear()
     obs = env.reset()
 
     for i in range(max_steps):
         action = policy.choose_action(obs)
         next_obs, reward, done, _ = env.step(action)
-        episode.append(Interaction(obs, action, reward))
+        episode.append(obs, action, reward, done)
         if done:
             return episode
         obs = next_obs
@@ -46,6 +142,49 @@ def obs_action_shape(env):
     return np.append(np.ravel(obs_space.high)+1, [env.action_space.n])
 
 
+def can_encode_state_ids(env):
+    """Return True if the state ids of env returned by obs_weights fit into 64 bit integers"""
+    return np.sum(np.log2(np.ravel(env.observation_space.high).astype(np.float64) + 1)) < 63
+
+
+def obs_weights(env):
+    """
+    Return the place values that encode an observation of env into a unique integer state id. Each tile is a digit
+    whose base is the number of values the tile can take, in row-major order.
+    """
+    assert can_encode_state_ids(env), "Observation space too large to encode into a 64 bit integer"
+    bases = np.ravel(env.observation_space.high).astype(np.int64) + 1
+    weights = np.ones_like(bases)
+    weights[:-1] = np.cumprod(bases[:0:-1])[::-1]
+    return weights
+
+
+def state_count(env):
+    """Return the number of distinct observations of env, which is one more than the largest state id"""
+    return int(np.prod(np.ravel(env.observation_space.high).astype(np.int64) + 1))
+
+
+def to_state_id(obs, weights):
+    """
+    Encode obs into a unique integer state id using the place values returned by obs_weights. If obs already is an
+    integer state id it is returned unchanged.
+    """
+    if isinstance(obs, (int, np.integer)):
+        return obs
+    return int(np.dot(np.ravel(obs), weights))
+
+
+def to_state_ids(states, weights):
+    """
+    Encode a batch of observations into integer state ids using the place values returned by obs_weights. If states
+    already is a one dimensional array of state ids it is returned unchanged.
+    """
+    states = np.asarray(states)
+    if states.ndim == 1:
+        return states
+    return states.reshape(len(states), -1) @ weights
+
+
 def to_table_index(obs, action=None):
     if action is not None:
         return tuple(np.ravel(obs)) + (action, )
@@ -53,21 +192,43 @@ def to_table_index(obs, action=None):
         return tuple(np.ravel(obs))
 
 
-def first_visit_rewards(episode: List[Interaction]) -> Tuple[ValuesView[Tuple[Any, Any, float]], float]:
+def first_visit_returns(episode: EpisodeBuffer, every_visit=False) -> Tuple[np.ndarray, np.ndarray, float]:
+    """
+    For each state-action pair visited in the episode return the total reward received from its first visit on to the
+    end of the episode.
+
+    :param every_visit: Return the total reward following every step instead of only first visits
+    :returns:
+        steps, returns, total_reward:
+            steps: Indices of the steps of episode that are first visits in ascending order
+            returns: The total reward received from each of those steps on
+            total_reward: The sum of rewards of the episode
+    """
+    if len(episode) == 0:
+        return np.zeros(0, dtype=np.intp), np.zeros(0), 0.0
+    returns = np.cumsum(episode.rewards[::-1])[::-1]
+    if every_visit:
+        steps = np.arange(len(episode))
+    elif episode.state_weights is not None:
+        _, steps = np.unique(episode.state_action_keys(), return_index=True)
+        steps.sort()
+    else:
+        # The observations cannot be encoded into integer keys, so the rows of observation and action are compared
+        state_action_pairs = np.column_stack((episode.obs.reshape(len(episode), -1), episode.actions))
+        _, steps = np.unique(state_action_pairs, axis=0, return_index=True)
+        steps.sort()
+    return steps, returns[steps], returns[0]
+
+
+def first_visit_rewards(episode: EpisodeBuffer, every_visit=False) -> Tuple[List[Tuple[np.ndarray, int, float]], float]:
     """
     For each state-action pair visited in the episode return the total reward after the first visit
 
+    :param every_visit: Return the total reward following every step instead of only first visits
     :returns:
         rewards, total_reward:
-            reward: Dict[obs_action] -> first visit reward
+            rewards: List of (obs, action, first visit reward) tuples
             total: The sum of reward of the episode
     """
-    rewards = {}
-    total_reward = 0.0
-    for interaction in reversed(episode):
-        obs, action, reward = interaction.obs, interaction.action, interaction.reward
-        total_reward += reward
-        # Note: This is a hack used since observations are not hashable: to_table_index maps state to a
-        # unique tuple that is hashable
-        rewards[to_table_index(obs, action)] = (obs, action, total_reward)
-    return rewards.values(), total_reward
+    steps, returns, total_reward = first_visit_returns(episode, every_visit)
+    return list(zip(episode.obs[steps], episode.actions[steps], returns)), total_reward
@@ -5,9 +5,16 @@ Utilities.Env
 Utility functions for evaluating methods
 """
 
+import multiprocessing
+import pickle
+import threading
+from math import sqrt
+from statistics import NormalDist
+
 import numpy as np
 from gym import Env
 from Policies import Policy
+from Utilities.MetricsFile import MetricsView, MetricsFileWriter
 
 
 class MetricsLogger:
@@ -15,8 +22,16 @@ class MetricsLogger:
     Logs performance statistics by collecting the values of all attributes of a given instance. Returns as numpy
     array that can be used efficiently with mathplotlib. Buffers have a maximum length. When this length is reached
     the oldest values get rotated out of the buffer when now values are added.
+
+    The values of all metrics are stored in the columns of a preallocated ring buffer. Every value is written twice,
+    max_length columns apart, so the last max_length values are always a contiguous slice of the buffer. Appending
+    takes constant time and the arrays returned by data are views that are only computed when accessed.
+
+    If a file is given, the complete history of all metrics is also streamed to it. See Utilities.MetricsFile. Call
+    close() when done to write the remaining values. A logger can be pickled to checkpoint a run, and an unpickled
+    logger continues the file where the pickled one was.
     """
-    def __init__(self, metrics, max_length=100000):
+    def __init__(self, metrics, max_length=100000, rolling_window=100, file=None, chunk_size=1024):
 
         self.count = 0
         """The number of elements in any array returned by data. Between 0 and max_length"""
@@ -35,59 +50,324 @@ class MetricsLogger:
         self.upper_bound = -1
         """The index of the last element returned by data. One less than the number of times append was called."""
         self.max_length = max_length
-        self.data = {key: [] for key in metrics.__dict__.keys()}
+        self.rolling_window = min(rolling_window, max_length)
+        """The number of most recent values rolling_mean averages over"""
+
+        keys = list(metrics.__dict__.keys())
+        self.data = MetricsView(keys, self._values)
         "Dict: each value in metrics -> numpy array of values that have been collected"
-        self.max = {key: float("-inf") for key in metrics.__dict__.keys()}
+        self.max = MetricsView(keys, self._maximum)
         "Dict: each value in metrics -> maximum value ever collected"
-        self.min = {key: float("inf") for key in metrics.__dict__.keys()}
+        self.min = MetricsView(keys, self._minimum)
         "Dict: each value in metrics -> minimum value ever collected"
+        self.rolling_mean = MetricsView(keys, self._rolling_mean)
+        "Dict: each value in metrics -> average of the last rolling_window values collected"
 
-        self._rollover_count = 0
-        self._next_index = 0
-        """Next index in data to write to"""
-        self._data = {key: np.zeros(2 * max_length) for key in metrics.__dict__.keys()}
+        self._keys = keys
+        self._buffer = np.zeros((len(keys), 2 * max_length))
+        self._max = np.full(len(keys), float("-inf"))
+        self._min = np.full(len(keys), float("inf"))
+        self._rolling_sum = np.zeros(len(keys))
+        """Sum of the finite values in the rolling window"""
+        self._rolling_invalid_count = np.zeros(len(keys), dtype=np.int64)
+        """Number of values in the rolling window that are not finite, which must not enter the sum"""
+        self._writer = None if file is None else MetricsFileWriter(file, keys, chunk_size)
 
     def append(self, metrics):
-        if self._next_index == 2 * self.max_length:
-            self._next_index = 0
-            self._rollover_count += 1
-            for metric in self._data.values():
-                np.roll(metric, self.max_length)
+        values = np.array([metrics.__dict__[key] for key in self._keys], dtype=np.float64)
+        append_count = self.upper_bound + 1
+        index = append_count % self.max_length
+        if append_count >= self.rolling_window:
+            # Remove the value that drops out of the window before it might be overwritten
+            self._add_to_rolling_window(self._buffer[:, (append_count - self.rolling_window) % self.max_length], -1)
+        self._add_to_rolling_window(values, 1)
+        self._buffer[:, index] = values
+        self._buffer[:, index + self.max_length] = values
+        if self._writer is not None:
+            self._writer.append(values)
+        # fmin and fmax ignore values that are not a number
+        np.fmin(self._min, values, out=self._min)
+        np.fmax(self._max, values, out=self._max)
 
-        self.count = min(self.max_length, self.count + 1)
         self.upper_bound += 1
-        for key, value in metrics.__dict__.items():
-            self.min[key] = min(self.min[key], value)
-            self.max[key] = max(self.max[key], value)
-            self._data[key][self._next_index] = value
-            start_index = max(0, self._next_index + 1 - self.max_length)
-            self.data[key] = self._data[key][start_index: start_index + self.count]
-            self.lower_bound = max(0, self.upper_bound + 1 - self.max_length)
-        self._next_index += 1
+        self.count = min(self.max_length, self.count + 1)
+        self.lower_bound = self.upper_bound + 1 - self.count
+
+    def flush(self):
+        """Write all values appended so far to the file, if any"""
+        if self._writer is not None:
+            self._writer.flush()
+
+    def close(self):
+        """Write the remaining values to the file and close it, if any"""
+        if self._writer is not None:
+            self._writer.close()
+
+    def tail(self, key, count):
+        """Return a view of the last count values of a metric, at most the count values returned by data"""
+        return self.data[key][self.count - min(count, self.count):]
+
+    def _add_to_rolling_window(self, values, sign):
+        finite = np.isfinite(values)
+        self._rolling_sum += sign * np.where(finite, values, 0)
+        self._rolling_invalid_count += sign * ~finite
+
+    def _minimum(self, index):
+        return float(self._min[index])
+
+    def _maximum(self, index):
+        return float(self._max[index])
+
+    def _values(self, index):
+        end = self.upper_bound % self.max_length + self.max_length + 1
+        return self._buffer[index, end - self.count:end]
+
+    def _rolling_mean(self, index):
+        if self.count == 0 or self._rolling_invalid_count[index] > 0:
+            return float("nan")
+        return float(self._rolling_sum[index]) / min(self.count, self.rolling_window)
+
+
+class ValidationSet:
+    """
+    A fixed set of initial states to validate policies on. The initial states are generated once and replayed by
+    passing them to env.reset(initial_state=...), so validation does not generate them again for every run. Requires
+    an environment that keeps the state of the grid in a state attribute and accepts it in reset(), like CleanBotEnv.
+
+    :param initial_states: (episode count, ...) array holding the initial state of each validation episode
+    """
+    def __init__(self, initial_states):
+        assert np.min(initial_states) >= 0 and np.max(initial_states) <= np.iinfo(np.uint8).max, \
+            "Unsupported states"
+        self.initial_states = np.asarray(initial_states, dtype=np.uint8)
 
+    def __len__(self):
+        return len(self.initial_states)
 
-def validate_policy(env: Env, policy: Policy, episode_count=1000, random_seed=52346, max_steps=10000) -> float:
+    @staticmethod
+    def generate(env: Env, episode_count=1000, random_seed=52346) -> "ValidationSet":
+        """
+        Generate the initial states of episode_count episodes by resetting env. Preserves the state of the random
+        number generator.
+        """
+        random_number_generator_state = np.random.get_state()
+        np.random.seed(random_seed)
+        try:
+            initial_states = np.zeros((episode_count, ) + np.shape(env.state), dtype=np.uint8)
+            for i in range(episode_count):
+                env.reset()
+                initial_states[i] = env.state
+        finally:
+            np.random.set_state(random_number_generator_state)
+        return ValidationSet(initial_states)
+
+    @staticmethod
+    def load(file) -> "ValidationSet":
+        """Load a validation set stored with save()"""
+        return ValidationSet(np.load(file, allow_pickle=False))
+
+    def save(self, file):
+        """Store the initial states in a .npy file"""
+        np.save(file, self.initial_states, allow_pickle=False)
+
+
+_validation = None
+"""
+(env, policy, max_steps, episode seeds, initial states) of the parallel validation in progress. Inherited by the forked
+worker processes.
+"""
+
+_pooled_validation = (None, None, None)
+"""(validation id, env, policy) of the validation a worker of a ValidationPool ran episodes of last"""
+
+
+class ValidationPool:
+    """
+    Worker processes that run validation episodes in parallel, to pass as workers to validate_policy. Unlike a number
+    of workers, which forks new processes for every validation, the processes are started once and reused by every
+    validation. They are spawned rather than forked, so the calling process may use TensorFlow or run other threads,
+    like the background trainer of KerasModel. The environment and the policy are pickled once per validation and
+    unpickled once per worker, so they must be picklable.
+
+    Call close() when done to stop the processes.
+
+    :param workers: The number of worker processes
+    """
+    def __init__(self, workers):
+        self.workers = workers
+        self._pool = multiprocessing.get_context("spawn").Pool(workers)
+        self._validation_count = 0
+
+    def run_episodes(self, env, policy, max_steps, episode_seeds, initial_states):
+        """Run one episode per initial state, each seeded with its own seed, and return their total rewards"""
+        self._validation_count += 1
+        validation = pickle.dumps((env, policy), protocol=pickle.HIGHEST_PROTOCOL)
+        tasks = [(self._validation_count, validation, max_steps, episode_seeds[episodes],
+                  [initial_states[episode] for episode in episodes.tolist()])
+                 for episodes in np.array_split(np.arange(len(initial_states)), 4 * self.workers)]
+        return np.concatenate(self._pool.starmap(_run_pooled_episodes, tasks))
+
+    def close(self):
+        """Stop the worker processes"""
+        self._pool.terminate()
+        self._pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def validate_policy(env: Env, policy: Policy, episode_count=1000, random_seed=52346, max_steps=10000,
+                    workers=None, validation_set: ValidationSet = None) -> float:
     """
     Return the average reward received after evaluating the policy episode_count times.
 
     Preserves the state of the random number generator.
+
+    :param workers: If None, the episodes are run one after another with the random number generator seeded once with
+        random_seed. Otherwise, every episode is seeded with its own seed derived from random_seed and the episodes
+        are spread over the given number of worker processes, or the processes of the given ValidationPool. The result
+        then does not depend on the number of workers. A number of workers forks new processes, which requires that
+        the calling process runs no other threads and that the policy and its model are usable in forked processes.
+    :param validation_set: If given, one episode is run from each of its initial states and episode_count is ignored.
+        The random number generator is then only used by the policy.
     """
+    initial_states = [None] * episode_count
+    if validation_set is not None:
+        initial_states = validation_set.initial_states
+        episode_count = len(validation_set)
+
+    if workers is not None:
+        return _validate_policy_parallel(env, policy, initial_states, random_seed, max_steps, workers)
+
     random_number_generator_state = np.random.get_state()
     np.random.seed(random_seed)
     total_reward = 0.0
     try:
-        for i in range(episode_count):
-            obs = env.reset()
-            done = False
-            for step in range(max_steps):
-                action = policy.choose_action(obs)
-                obs, reward, done, _ = env.step(action)
-                total_reward += reward
-                if done:
-                    break
-            if not done:
-                raise Exception("Episode did not terminate")
+        for initial_state in initial_states:
+            total_reward += _run_episode(env, policy, max_steps, initial_state)
     finally:
         np.random.set_state(random_number_generator_state)
 
     return total_reward / episode_count
+
+
+class ValidationResult:
+    """Result of validate_policy_sequential"""
+    def __init__(self, mean, ci_half_width, episode_count):
+        self.mean = mean
+        """The average reward of the validation episodes"""
+        self.ci_half_width = ci_half_width
+        """Half width of the confidence interval of the mean. nan if less than two episodes were run."""
+        self.episode_count = episode_count
+        """The number of episodes that were run"""
+
+
+def validate_policy_sequential(env: Env, policy: Policy, ci_half_width, confidence=0.95, min_episode_count=30,
+                               max_episode_count=1000, random_seed=52346, max_steps=10000,
+                               validation_set: ValidationSet = None) -> ValidationResult:
+    """
+    Evaluate the policy until the confidence interval of the average reward is narrower than required. The mean and
+    variance of the rewards are updated after every episode with Welford's algorithm, and validation stops as soon as
+    the half width of the confidence interval is at most ci_half_width, or after max_episode_count episodes.
+
+    Preserves the state of the random number generator.
+
+    :param ci_half_width: The required half width of the confidence interval
+    :param confidence: The confidence level of the interval
+    :param min_episode_count: The number of episodes that are always run, such that the variance estimate is reliable
+    :param max_episode_count: The number of episodes after which validation stops in any case
+    :param validation_set: If given, episodes are run from its initial states in order. At most one episode per initial
+        state is run.
+    """
+    initial_states = [None] * max_episode_count
+    if validation_set is not None:
+        initial_states = validation_set.initial_states[:max_episode_count]
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+
+    random_number_generator_state = np.random.get_state()
+    np.random.seed(random_seed)
+    count, mean, squared_deviations, half_width = 0, 0.0, 0.0, float("nan")
+    try:
+        for initial_state in initial_states:
+            reward = _run_episode(env, policy, max_steps, initial_state)
+            count += 1
+            delta = reward - mean
+            mean += delta / count
+            squared_deviations += delta * (reward - mean)
+            if count > 1:
+                half_width = z * sqrt(squared_deviations / (count - 1) / count)
+                if count >= min_episode_count and half_width <= ci_half_width:
+                    break
+    finally:
+        np.random.set_state(random_number_generator_state)
+
+    return ValidationResult(mean, half_width, count)
+
+
+def _validate_policy_parallel(env, policy, initial_states, random_seed, max_steps, workers):
+    global _validation
+    episode_count = len(initial_states)
+    episode_seeds = np.random.SeedSequence(random_seed).generate_state(episode_count)
+    random_number_generator_state = np.random.get_state()
+    _validation = (env, policy, max_steps, episode_seeds, initial_states)
+    try:
+        if isinstance(workers, ValidationPool):
+            rewards = workers.run_episodes(env, policy, max_steps, episode_seeds, initial_states)
+        elif workers == 1:
+            rewards = _run_seeded_episodes(np.arange(episode_count))
+        else:
+            assert threading.active_count() == 1, \
+                "Forking while other threads are running is unsafe. Pass a ValidationPool as workers instead."
+            # The workers are forked after _validation has been set, so env and policy are not pickled
+            with multiprocessing.get_context("fork").Pool(workers) as pool:
+                rewards = np.concatenate(pool.map(_run_seeded_episodes,
+                                                  np.array_split(np.arange(episode_count), 4 * workers)))
+    finally:
+        _validation = None
+        np.random.set_state(random_number_generator_state)
+
+    # The rewards are summed in the order of the episodes, so the result is the same for any number of workers
+    return float(np.sum(rewards)) / episode_count
+
+
+def _run_seeded_episodes(episodes):
+    """Run the given episodes of the validation in progress, each with its own seed, and return their total rewards"""
+    env, policy, max_steps, episode_seeds, initial_states = _validation
+    rewards = np.zeros(len(episodes))
+    for i, episode in enumerate(episodes.tolist()):
+        np.random.seed(episode_seeds[episode])
+        rewards[i] = _run_episode(env, policy, max_steps, initial_states[episode])
+    return rewards
+
+
+def _run_pooled_episodes(validation_id, validation, max_steps, episode_seeds, initial_states):
+    """Run episodes of a validation in a worker of a ValidationPool and return their total rewards"""
+    global _pooled_validation
+    if _pooled_validation[0] != validation_id:
+        # Release the copy of the previous validation, e.g. the background trainer of its model
+        previous_model = getattr(_pooled_validation[2], "model", None)
+        if previous_model is not None:
+            previous_model.close()
+        _pooled_validation = (validation_id, ) + pickle.loads(validation)
+    _, env, policy = _pooled_validation
+    rewards = np.zeros(len(episode_seeds))
+    for i, (seed, initial_state) in enumerate(zip(episode_seeds.tolist(), initial_states)):
+        np.random.seed(seed)
+        rewards[i] = _run_episode(env, policy, max_steps, initial_state)
+    return rewards
+
+
+def _run_episode(env, policy, max_steps, initial_state=None):
+    """Run a single episode and return the total reward received"""
+    total_reward = 0.0
+    obs = env.reset() if initial_state is None else env.reset(initial_state=initial_state)
+    for step in range(max_steps):
+        action = policy.choose_action(obs)
+        obs, reward, done, _ = env.step(action)
+        total_reward += reward
+        if done:
+            return total_reward
+    raise Exception("Episode did not terminate")
@@ -0,0 +1,227 @@
+"""
+Utilities.MetricsFile
+=====================
+
+Append-only files that store the complete history of metrics logged during an experiment. A file starts with a small
+header holding the metric names, the chunk size, the number of committed rows and the minimum and maximum of every
+metric, followed by chunks of chunk_size rows. Within a chunk, the values of every metric are stored contiguously as
+float64, such that a reader can memory map the file and access a metric without loading the others.
+
+The writer only increases the row count in the header after the rows have been written, so a reader may open the
+file of an experiment that is still running.
+"""
+
+import json
+import os
+import struct
+import time
+from collections.abc import Mapping
+
+import numpy as np
+
+_MAGIC = b"DRLMTRC1"
+_HEADER = struct.Struct("<8sQQQQ")
+"""magic, header size, chunk size, metric count, row count. Followed by the minimum and maximum of every metric and the
+metric names as JSON."""
+
+
+class MetricsView(Mapping):
+    """Read-only dict from the name of each metric to a value that is computed when accessed"""
+    def __init__(self, keys, get_value):
+        self._indices = {key: index for index, key in enumerate(keys)}
+        self._get_value = get_value
+
+    def __getitem__(self, key):
+        return self._get_value(self._indices[key])
+
+    def __iter__(self):
+        return iter(self._indices)
+
+    def __len__(self):
+        return len(self._indices)
+
+
+class MetricsFileWriter:
+    """
+    Writes rows of metrics to a metrics file. Rows are collected in memory and written when a chunk is complete, or
+    when flush() is called, which happens at least every sync_interval seconds. flush() also forces the data to disk.
+
+    Pickling or unpickling a writer does not write to the file. When an unpickled writer is first used, it continues
+    the file where the pickled one was. It discards rows that have been appended since and writes the rows the pickled
+    writer held in memory, so a run can be resumed from a checkpoint. Call flush() before pickling to make sure the
+    file holds all rows of the checkpoint in case the pickled writer is never used.
+
+    :param file: Path of the file. An existing file is overwritten.
+    :param keys: The names of the metrics
+    :param chunk_size: The number of rows per chunk
+    :param sync_interval: Maximum number of seconds between two calls of flush()
+    """
+    def __init__(self, file, keys, chunk_size=1024, sync_interval=10.0):
+        self.file = file
+        self.keys = list(keys)
+        self.chunk_size = chunk_size
+        self.sync_interval = sync_interval
+        self.row_count = 0
+        """The number of rows appended"""
+
+        names = json.dumps(self.keys).encode()
+        self._fixed_header_size = _HEADER.size + 16 * len(self.keys)
+        self._header_size = -(-(self._fixed_header_size + len(names)) // 64) * 64
+        self._chunk = np.zeros((len(self.keys), chunk_size))
+        self._min = np.full(len(self.keys), float("inf"))
+        self._max = np.full(len(self.keys), float("-inf"))
+
+        self._file = open(file, "w+b")
+        self._write_header()
+        self._file.write(names.ljust(self._header_size - self._fixed_header_size))
+        self._file.flush()
+        self._last_sync = time.monotonic()
+
+    def append(self, values):
+        """Append a row holding a value of every metric in the order of keys"""
+        index = self.row_count % self.chunk_size
+        self._chunk[:, index] = values
+        np.fmin(self._min, self._chunk[:, index], out=self._min)
+        np.fmax(self._max, self._chunk[:, index], out=self._max)
+        self.row_count += 1
+        if index == self.chunk_size - 1:
+            self._write_chunk()
+        if time.monotonic() - self._last_sync >= self.sync_interval:
+            self.flush()
+
+    def flush(self):
+        """Write and commit all appended rows and force them to disk"""
+        self._write_chunk()
+        os.fsync(self._file.fileno())
+        self._last_sync = time.monotonic()
+
+    def close(self):
+        # An unpickled writer that has not been used has nothing to write
+        if self._file is not None and not self._file.closed:
+            self.flush()
+            self._file.close()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_file"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        # The file is opened when the writer is first used
+        self._file = None
+        self._last_sync = time.monotonic()
+
+    def _reopen(self):
+        """Continue the file of an unpickled writer, discarding rows that have been appended to the file since"""
+        self._file = open(self.file, "r+b")
+        chunk_count = -(-self.row_count // self.chunk_size)
+        self._file.truncate(self._header_size + chunk_count * self._chunk.nbytes)
+        self._write_header()
+        self._file.flush()
+
+    def _write_chunk(self):
+        """Write the current chunk, which may be incomplete, and commit all rows appended so far"""
+        if self._file is None:
+            self._reopen()
+        if self.row_count == 0:
+            return
+        chunk_index = (self.row_count - 1) // self.chunk_size
+        self._file.seek(self._header_size + chunk_index * self._chunk.nbytes)
+        self._file.write(self._chunk.tobytes())
+        # The rows must be written before they are committed
+        self._file.flush()
+        self._file.seek(0)
+        self._write_header()
+        self._file.flush()
+
+    def _write_header(self):
+        self._file.write(_HEADER.pack(_MAGIC, self._header_size, self.chunk_size, len(self.keys), self.row_count))
+        self._file.write(self._min.tobytes())
+        self._file.write(self._max.tobytes())
+
+
+class MetricsFileReader:
+    """
+    Memory maps a metrics file. Provides the same attributes as MetricsLogger (count, lower_bound, upper_bound, data,
+    min, max and tail()), so it can be plotted with PlotUtilities.LivePlot. Only the last max_length rows are returned
+    by data. Call refresh() to see rows that have been committed since the file was opened.
+
+    The values of a metric are only contiguous within a chunk. Unless the rows returned by data lie in a single chunk,
+    every access of data copies them into memory, so max_length bounds the memory used. Use tail() to read a few of
+    the last values and chunks() to access the complete history without copying it.
+
+    :param file: Path of the file
+    :param max_length: The maximum number of rows returned by data. All rows if None, which copies the complete
+        history of a metric whenever it is accessed.
+    """
+    def __init__(self, file, max_length=100000):
+        self.file = file
+        self.max_length = max_length
+        with open(file, "rb") as f:
+            magic, self._header_size, self.chunk_size, metric_count, _ = _HEADER.unpack(f.read(_HEADER.size))
+            if magic != _MAGIC:
+                raise ValueError(f"{file} is not a metrics file")
+            f.seek(_HEADER.size + 16 * metric_count)
+            self.keys = json.loads(f.read(self._header_size - _HEADER.size - 16 * metric_count).decode())
+
+        self.row_count = 0
+        """The number of committed rows"""
+        self.count = 0
+        """The number of elements in any array returned by data"""
+        self.lower_bound = 0
+        """The index of the first row returned by data"""
+        self.upper_bound = -1
+        """The index of the last row returned by data"""
+        self.data = MetricsView(self.keys, self._values)
+        "Dict: each metric -> numpy array of the last count values"
+        self.min = MetricsView(self.keys, lambda index: float(self._min[index]))
+        "Dict: each metric -> minimum value of all rows"
+        self.max = MetricsView(self.keys, lambda index: float(self._max[index]))
+        "Dict: each metric -> maximum value of all rows"
+
+        self._min = self._max = np.zeros(len(self.keys))
+        self._chunks = np.zeros((0, len(self.keys), self.chunk_size))
+        self.refresh()
+
+    def refresh(self):
+        """Read the number of committed rows again and map chunks that have been added since"""
+        metric_count = len(self.keys)
+        with open(self.file, "rb") as f:
+            header = f.read(_HEADER.size + 16 * metric_count)
+        self.row_count = _HEADER.unpack_from(header)[4]
+        extremes = np.frombuffer(header, dtype=np.float64, offset=_HEADER.size)
+        self._min, self._max = extremes[:metric_count], extremes[metric_count:]
+
+        chunk_count = -(-self.row_count // self.chunk_size)
+        if chunk_count > len(self._chunks):
+            self._chunks = np.memmap(self.file, dtype=np.float64, mode="r", offset=self._header_size,
+                                     shape=(chunk_count, metric_count, self.chunk_size))
+
+        self.count = self.row_count if self.max_length is None else min(self.row_count, self.max_length)
+        self.upper_bound = self.row_count - 1
+        self.lower_bound = self.row_count - self.count
+
+    def tail(self, key, count):
+        """Return the last count committed values of a metric. Only these values are copied, if any."""
+        count = min(count, self.row_count)
+        return self._window(self.keys.index(key), self.row_count - count, count)
+
+    def chunks(self, key):
+        """
+        Return a (chunk count, chunk size) view of all values of a metric without copying them. Only the first
+        row_count values are valid.
+        """
+        return self._chunks[:, self.keys.index(key)]
+
+    def _values(self, index):
+        return self._window(index, self.lower_bound, self.count)
+
+    def _window(self, index, first_row, count):
+        """Return count values of a metric starting at first_row. A view of the file if they lie in a single chunk."""
+        first_chunk, start = divmod(first_row, self.chunk_size)
+        last_chunk = (first_row + max(count, 1) - 1) // self.chunk_size
+        if first_chunk == last_chunk:
+            return self._chunks[first_chunk, index, start:start + count] if count > 0 else np.zeros(0)
+        # Reshaping the strided view copies the values of the chunks
+        return self._chunks[first_chunk:last_chunk + 1, index].reshape(-1)[start:start + count]
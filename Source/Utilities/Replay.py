@@ -0,0 +1,129 @@
+"""
+Utilities.Replay
+================
+
+Fixed capacity experience replay memories. Experience is stored in preallocated ring buffers, so memory is bounded and
+inserting does not allocate.
+"""
+
+import numpy as np
+
+
+class ReplayBuffer:
+    """
+    Ring buffer of (observation, action, target value) triples from which minibatches are sampled uniformly. Once the
+    buffer is full, the oldest experience is overwritten.
+
+    :param capacity: The maximum number of triples stored
+    :param obs_shape: The shape of a single observation
+    :param obs_dtype: The type used to store observations
+    """
+
+    def __init__(self, capacity, obs_shape, obs_dtype=np.uint8):
+        self.capacity = capacity
+        """The maximum number of triples stored"""
+        self.obs = np.zeros((capacity, ) + tuple(obs_shape), dtype=obs_dtype)
+        """Stored observations. Only the first len(self) entries are valid."""
+        self.actions = np.zeros(capacity, dtype=np.int32)
+        """Stored actions. Only the first len(self) entries are valid."""
+        self.targets = np.zeros(capacity, dtype=np.float32)
+        """Stored target values of the actions. Only the first len(self) entries are valid."""
+
+        self._size = 0
+        self._next_index = 0
+
+    def __len__(self):
+        return self._size
+
+    def add(self, obs, action, target):
+        """
+        Store a triple, overwriting the oldest one if the buffer is full.
+
+        :returns: The index the triple was stored at
+        """
+        index = self._next_index
+        self.obs[index] = obs
+        self.actions[index] = action
+        self.targets[index] = target
+        self._next_index = (index + 1) % self.capacity
+        self._size = min(self._size + 1, self.capacity)
+        return index
+
+    def sample(self, batch_size):
+        """
+        Sample a minibatch.
+
+        :returns:
+            indices, weights:
+                indices: Indices of the sampled triples
+                weights: Weight of each sampled triple to use during fitting
+        """
+        return np.random.randint(0, self._size, size=batch_size), np.ones(batch_size, dtype=np.float32)
+
+    def update_priorities(self, indices, errors):
+        """Report the errors of the model on sampled triples. Ignored by uniform sampling."""
+        pass
+
+
+class PrioritizedReplayBuffer(ReplayBuffer):
+    """
+    Replay buffer that samples triples with a probability proportional to their error to the power of alpha, as
+    proposed in "Prioritized Experience Replay" by Schaul et al. The bias this introduces is corrected by weighting each
+    sample with its importance sampling weight to the power of beta. Priorities are kept in a sum tree, so sampling and
+    updates take logarithmic time.
+
+    :param capacity: The maximum number of triples stored
+    :param obs_shape: The shape of a single observation
+    :param obs_dtype: The type used to store observations
+    :param alpha: How much prioritization is used. 0 is uniform sampling
+    :param beta: How much the sampling bias is corrected. 1 is full correction
+    :param epsilon: Added to every error, such that every triple has a chance to be sampled
+    """
+
+    def __init__(self, capacity, obs_shape, obs_dtype=np.uint8, alpha=0.6, beta=0.4, epsilon=1e-3):
+        super().__init__(capacity, obs_shape, obs_dtype)
+        self.alpha = alpha
+        self.beta = beta
+        self.epsilon = epsilon
+
+        self._leaf_count = 1 << int(np.ceil(np.log2(max(capacity, 2))))
+        self._tree = np.zeros(2 * self._leaf_count)
+        """Sum tree. Node i has the children 2i and 2i+1, leaves start at _leaf_count, index 0 is unused."""
+        self._max_priority = 1.0
+
+    def add(self, obs, action, target):
+        index = super().add(obs, action, target)
+        # New experience is sampled at least once with high probability
+        self._set_priority(index, self._max_priority)
+        return index
+
+    def sample(self, batch_size):
+        # Split the total priority into batch_size segments and descend the tree from a random point in each segment.
+        # All samples descend the tree together.
+        total = self._tree[1]
+        points = (np.arange(batch_size) + np.random.random_sample(batch_size)) * (total / batch_size)
+        nodes = np.ones(batch_size, dtype=np.int64)
+        while nodes[0] < self._leaf_count:
+            left = 2 * nodes
+            left_sums = self._tree[left]
+            go_right = points >= left_sums
+            points -= np.where(go_right, left_sums, 0)
+            nodes = left + go_right
+        indices = np.minimum(nodes - self._leaf_count, self._size - 1)
+
+        probabilities = self._tree[indices + self._leaf_count] / total
+        weights = (self._size * probabilities) ** -self.beta
+        return indices, (weights / weights.max()).astype(np.float32)
+
+    def update_priorities(self, indices, errors):
+        priorities = (np.abs(errors) + self.epsilon) ** self.alpha
+        for index, priority in zip(indices.tolist(), priorities.tolist()):
+            self._set_priority(index, priority)
+        self._max_priority = max(self._max_priority, float(priorities.max()))
+
+    def _set_priority(self, index, priority):
+        node = index + self._leaf_count
+        delta = priority - self._tree[node]
+        while node >= 1:
+            self._tree[node] += delta
+            node //= 2
@@ -0,0 +1,56 @@
+import pickle
+import unittest
+import numpy as np
+from CleanBotEnv import CleanBotEnv
+from Methods.ActorLearner import ActorLearnerMC, HOGWILD, LEARNER
+from Models.SharedTableModel import SharedTableModel
+from utilities import MockEnv
+
+EAST = CleanBotEnv.BotActions.EAST.value
+
+
+def create_env():
+    return CleanBotEnv(3)
+
+
+class TestSharedTableModel(unittest.TestCase):
+
+    def test_pickled_copy_shares_table(self):
+        env = MockEnv(3)
+        model = SharedTableModel(env)
+        try:
+            obs = env.reset()
+            copy = pickle.loads(pickle.dumps(model))
+            copy.update_action_value(obs, EAST, 2.5)
+            self.assertEqual(2.5, model.action_value(obs, EAST))
+            self.assertEqual(EAST, model.greedy_action(obs))
+            copy.close()
+            self.assertEqual(2.5, model.action_value(obs, EAST))
+        finally:
+            model.close()
+
+
+class TestActorLearnerMC(unittest.TestCase):
+
+    def run_method(self, mode):
+        model = SharedTableModel(create_env())
+        try:
+            with ActorLearnerMC(create_env, model, actor_count=2, mode=mode, seed=643674) as method:
+                for i in range(20):
+                    reward = method.run_episode()
+                    self.assertEqual(reward, method.metrics.episode_reward)
+                    self.assertIsNotNone(method.metrics.rms)
+            # Updates of the actors or the learner are visible in the table of this process
+            self.assertGreater(np.count_nonzero(model.value_function), 0)
+        finally:
+            model.close()
+
+    def test_hogwild(self):
+        self.run_method(HOGWILD)
+
+    def test_learner(self):
+        self.run_method(LEARNER)
+
+
+if __name__ == '__main__':
+    unittest.main()
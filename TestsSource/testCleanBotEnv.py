@@ -1,5 +1,5 @@
 import numpy as np
-from CleanBotEnv import CleanBotEnv
+from CleanBotEnv import CleanBotEnv, VecCleanBotEnv
 import unittest
 
 
@@ -38,6 +38,44 @@ class TestCleanBotEnv(unittest.TestCase):
         response = env.step(CleanBotEnv.BotActions.CLEAN.value)
         check_state((2, 4), reward=42, done=True)
 
+    def test_reset_to_initial_state(self):
+        env = CleanBotEnv(3)
+        env.step(CleanBotEnv.BotActions.SOUTH.value)
+        random_state = np.random.get_state()
+        obs = env.reset(initial_state=np.array([[0, 1, 0], [0, 0, 0], [1, 0, 1]], dtype=np.uint8))
+        np.testing.assert_array_equal([[2, 1, 0], [0, 0, 0], [1, 0, 1]], obs)
+        self.assertEqual(3, env.dirty_count)
+        self.assertEqual(0, env.step_count)
+        # No random numbers are drawn
+        np.testing.assert_array_equal(random_state[1], np.random.get_state()[1])
+
+    def test_vectorized_env(self):
+        """Checks that VecCleanBotEnv matches a list of CleanBotEnv instances step for step"""
+        num_envs = 6
+        step_count = 200
+        actions = np.random.RandomState(5678).randint(5, size=(step_count, num_envs))
+
+        # Both variants draw from the global random number generator, so run them one after the other
+        np.random.seed(34567876)
+        vec_env = VecCleanBotEnv(3, num_envs)
+        vec_responses = [vec_env.step(actions[step]) for step in range(step_count)]
+
+        np.random.seed(34567876)
+        envs = [CleanBotEnv(3) for _ in range(num_envs)]
+        done_count = 0
+        for step in range(step_count):
+            observations, rewards, dones, info = vec_responses[step]
+            for i, env in enumerate(envs):
+                obs, reward, done, _ = env.step(actions[step, i])
+                self.assertEqual(reward, rewards[i])
+                self.assertEqual(done, dones[i])
+                if done:
+                    np.testing.assert_array_equal(obs, info["terminal_observation"][i])
+                    obs = env.reset()
+                    done_count += 1
+                np.testing.assert_array_equal(obs, observations[i])
+        self.assertGreater(done_count, num_envs)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,88 @@
+import unittest
+import numpy as np
+from CleanBotEnv import CleanBotEnv
+from Utilities.Env import EpisodeBuffer, record_episode, first_visit_rewards, first_visit_returns, to_table_index
+from Models.TableModel import TableModel
+from Policies import EpsilonGreedyPolicy
+from utilities import MockEnv, MockPolicy
+
+SOUTH = CleanBotEnv.BotActions.SOUTH.value
+EAST = CleanBotEnv.BotActions.EAST.value
+WEST = CleanBotEnv.BotActions.WEST.value
+CLEAN = CleanBotEnv.BotActions.CLEAN.value
+
+
+class TestRecordEpisode(unittest.TestCase):
+
+    def test_record_episode(self):
+        env = MockEnv(3)
+        episode = EpisodeBuffer(env, capacity=2)
+        record_episode(env, MockPolicy([EAST, EAST, SOUTH, WEST, WEST, CLEAN]), episode=episode)
+
+        self.assertEqual(6, len(episode))
+        self.assertEqual((6, 3, 3), episode.obs.shape)
+        self.assertEqual(np.uint8, episode.obs.dtype)
+        np.testing.assert_array_equal([[2, 0, 0], [1, 0, 0], [0, 0, 0]], episode.obs[0])
+        np.testing.assert_array_equal([[0, 0, 0], [1, 0, 0], [0, 0, 0]], episode.obs[5])
+        np.testing.assert_array_equal([EAST, EAST, SOUTH, WEST, WEST, CLEAN], episode.actions)
+        np.testing.assert_array_equal([0, 0, 0, 0, 0, 12], episode.rewards)
+        np.testing.assert_array_equal([False] * 5 + [True], episode.done)
+
+        # The buffer is reused for the next episode
+        record_episode(env, MockPolicy([SOUTH, CLEAN]), episode=episode)
+        self.assertEqual(2, len(episode))
+        np.testing.assert_array_equal([SOUTH, CLEAN], episode.actions)
+        np.testing.assert_array_equal([0, 16], episode.rewards)
+
+    def test_first_visit_rewards(self):
+        env = MockEnv(3)
+        episode = record_episode(env, MockPolicy([EAST, WEST, EAST, WEST, SOUTH, CLEAN]))
+        rewards, total_reward = first_visit_rewards(episode)
+
+        self.assertEqual(12, total_reward)
+        self.assertEqual(4, len(rewards))
+        for obs, action, reward in rewards:
+            self.assertEqual(12, reward)
+
+    def test_first_visit_returns(self):
+        """Compare with a straight forward implementation on random episodes"""
+        np.random.seed(643674)
+        env = CleanBotEnv(3)
+        policy = EpsilonGreedyPolicy(TableModel(env), 1.0)
+        episode = EpisodeBuffer(env)
+        for i in range(20):
+            record_episode(env, policy, episode=episode)
+            expected_first, expected_every = {}, []
+            total_reward = 0.0
+            for obs, action, reward in zip(episode.obs[::-1], episode.actions[::-1], episode.rewards[::-1]):
+                total_reward += reward
+                expected_first[to_table_index(obs, action)] = total_reward
+                expected_every.append(total_reward)
+
+            rewards, first_visit_total = first_visit_rewards(episode)
+            self.assertEqual(total_reward, first_visit_total)
+            self.assertEqual(expected_first, {to_table_index(obs, action): ret for obs, action, ret in rewards})
+
+            steps, returns, every_visit_total = first_visit_returns(episode, every_visit=True)
+            self.assertEqual(total_reward, every_visit_total)
+            np.testing.assert_array_equal(np.arange(len(episode)), steps)
+            np.testing.assert_array_equal(expected_every[::-1], returns)
+
+    def test_first_visit_returns_without_state_ids(self):
+        """Observations that do not fit into 64 bit state ids are compared row by row"""
+        np.random.seed(643674)
+        env = CleanBotEnv(8)
+        episode = EpisodeBuffer(env)
+        self.assertIsNone(episode.state_weights)
+        record_episode(env, MockPolicy(np.random.randint(env.action_space.n, size=env.max_steps)), episode=episode)
+        steps, returns, total_reward = first_visit_returns(episode)
+        expected_steps = {}
+        for step, (obs, action) in enumerate(zip(episode.obs, episode.actions)):
+            expected_steps.setdefault(to_table_index(obs, action), step)
+        np.testing.assert_array_equal(sorted(expected_steps.values()), steps)
+        np.testing.assert_array_equal(np.cumsum(episode.rewards[::-1])[::-1][steps], returns)
+        self.assertEqual(np.sum(episode.rewards), total_reward)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,8 +1,13 @@
+import os
+import tempfile
 import unittest
 import numpy as np
 from numpy.testing import assert_array_equal
 
-from Utilities.Eval import MetricsLogger
+from CleanBotEnv import CleanBotEnv
+from Models.TableModel import TableModel
+from Policies import EpsilonGreedyPolicy
+from Utilities.Eval import MetricsLogger, ValidationPool, ValidationSet, validate_policy, validate_policy_sequential
 
 
 class Metrics:
@@ -19,8 +24,8 @@ class TestMetricsCollector(unittest.TestCase):
         collector = MetricsLogger(metrics)
 
         self.assertEqual(2, len(collector.data))
-        self.assertEqual([], collector.data["cat_count"])
-        self.assertEqual([], collector.data["dog_count"])
+        assert_array_equal([], collector.data["cat_count"])
+        assert_array_equal([], collector.data["dog_count"])
 
         # Add 5
         metrics.cat_count = 5
@@ -99,6 +104,99 @@ class TestMetricsCollector(unittest.TestCase):
         assert_array_equal(collector.data["cat_count"], np.arange(2 * max_length, 3 * max_length))
         assert_array_equal(collector.data["dog_count"], np.arange(2 * max_length + 100, 3 * max_length + 100))
 
+    def test_rolling_mean(self):
+        metrics = Metrics()
+        collector = MetricsLogger(metrics, max_length=8, rolling_window=3)
+        self.assertTrue(np.isnan(collector.rolling_mean["cat_count"]))
+
+        for i in range(20):
+            metrics.cat_count = i
+            metrics.dog_count = float("nan") if i == 5 else -i
+            collector.append(metrics)
+            self.assertAlmostEqual(np.mean(collector.data["cat_count"][-3:]), collector.rolling_mean["cat_count"])
+            assert_array_equal(np.mean(collector.data["dog_count"][-3:]), collector.rolling_mean["dog_count"])
+            # The values are a view of the buffer
+            self.assertTrue(collector.data["cat_count"].flags.c_contiguous)
+            self.assertFalse(collector.data["cat_count"].flags.owndata)
+
+        assert_array_equal(np.arange(12, 20), collector.data["cat_count"])
+        # Values that are not a number are ignored by min and max
+        self.assertEqual(-19, collector.min["dog_count"])
+        self.assertEqual(0, collector.max["dog_count"])
+
+
+class TestValidatePolicy(unittest.TestCase):
+
+    def test_parallel_is_deterministic(self):
+        env = CleanBotEnv(3)
+        policy = EpsilonGreedyPolicy(TableModel(env), 0.5)
+        np.random.seed(643674)
+        random_state = np.random.get_state()
+
+        single = validate_policy(env, policy, episode_count=30, workers=1)
+        self.assertEqual(single, validate_policy(env, policy, episode_count=30, workers=2))
+        self.assertEqual(single, validate_policy(env, policy, episode_count=30, workers=3))
+        with ValidationPool(2) as pool:
+            self.assertEqual(single, validate_policy(env, policy, episode_count=30, workers=pool))
+            # The pool runs the current policy of every validation
+            policy.exploration = 0.2
+            self.assertEqual(validate_policy(env, policy, episode_count=30, workers=1),
+                             validate_policy(env, policy, episode_count=30, workers=pool))
+        # The state of the random number generator is preserved
+        assert_array_equal(random_state[1], np.random.get_state()[1])
+
+        # Sequential validation is reproducible as well
+        self.assertEqual(validate_policy(env, policy, episode_count=30),
+                         validate_policy(env, policy, episode_count=30))
+
+    def test_validation_set(self):
+        env = CleanBotEnv(3)
+        policy = EpsilonGreedyPolicy(TableModel(env), 0.5)
+        validation_set = ValidationSet.generate(env, episode_count=20, random_seed=1234)
+        self.assertEqual(20, len(validation_set))
+        self.assertEqual(np.uint8, validation_set.initial_states.dtype)
+
+        # The same initial states as random resets
+        np.random.seed(1234)
+        for initial_state in validation_set.initial_states:
+            env.reset()
+            assert_array_equal(env.state, initial_state)
+
+        with tempfile.TemporaryDirectory() as directory:
+            file = os.path.join(directory, "validation_set.npy")
+            validation_set.save(file)
+            loaded = ValidationSet.load(file)
+        assert_array_equal(validation_set.initial_states, loaded.initial_states)
+
+        average = validate_policy(env, policy, validation_set=validation_set)
+        self.assertEqual(average, validate_policy(env, policy, validation_set=loaded))
+        self.assertEqual(validate_policy(env, policy, validation_set=validation_set, workers=1),
+                         validate_policy(env, policy, validation_set=validation_set, workers=2))
+
+    def test_sequential(self):
+        env = CleanBotEnv(3)
+        policy = EpsilonGreedyPolicy(TableModel(env), 0.5)
+
+        # An unreachable target runs the maximum number of episodes, which gives the same result as validate_policy
+        result = validate_policy_sequential(env, policy, ci_half_width=0, max_episode_count=40)
+        self.assertEqual(40, result.episode_count)
+        self.assertAlmostEqual(validate_policy(env, policy, episode_count=40), result.mean)
+        self.assertGreater(result.ci_half_width, 0)
+
+        # A wide target stops after the minimum number of episodes
+        target = result.ci_half_width * 2
+        result = validate_policy_sequential(env, policy, ci_half_width=target, min_episode_count=10,
+                                            max_episode_count=40)
+        self.assertLess(result.episode_count, 40)
+        self.assertGreaterEqual(result.episode_count, 10)
+        self.assertLessEqual(result.ci_half_width, target)
+
+        # At most one episode per initial state of a validation set
+        validation_set = ValidationSet.generate(env, episode_count=5)
+        result = validate_policy_sequential(env, policy, ci_half_width=0, validation_set=validation_set)
+        self.assertEqual(5, result.episode_count)
+        self.assertAlmostEqual(validate_policy(env, policy, validation_set=validation_set), result.mean)
+
 
 if __name__ == '__main__':
     unittest.main()
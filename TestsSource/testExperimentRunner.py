@@ -0,0 +1,187 @@
+import functools
+import os
+import tempfile
+import unittest
+import numpy as np
+from numpy.testing import assert_array_equal
+from CleanBotEnv import CleanBotEnv
+from Experiments.Experiment import Experiment, DefaultSuite
+from Experiments.ExperimentRunner import run_experiment, run_experiment_suite
+from Methods.MonteCarlo import AlphaMC
+from Models.TableModel import TableModel
+from Policies import EpsilonGreedyPolicy, GreedyPolicy
+
+
+class SmallExperiment(Experiment):
+    created_count = 0
+
+    def __init__(self, alpha):
+        super().__init__()
+        SmallExperiment.created_count += 1
+        self.env = CleanBotEnv(3)
+        self.model = TableModel(self.env)
+        self.training_policy = EpsilonGreedyPolicy(self.model, 0.1)
+        self.testing_policy = GreedyPolicy(self.model)
+        self.method = AlphaMC(self.env, self.model, self.training_policy)
+        self.method.alpha = alpha
+        self.name = f"SmallExperiment-{alpha}"
+
+
+class FailingExperiment(SmallExperiment):
+    def __init__(self, alpha):
+        super().__init__(alpha)
+        raise ValueError("Experiment failed")
+
+
+def create_env():
+    return CleanBotEnv(3)
+
+
+def create_env_factory(size):
+    def create_sized_env():
+        return CleanBotEnv(size)
+    return create_sized_env
+
+
+def small_suite(alphas=(0.1, 0.05, 0.02), validation_workers=None):
+    return DefaultSuite(SmallExperiment, [{"alpha": alpha} for alpha in alphas], episode_count=40,
+                        validation_frequency=20, validation_episode_count=10, validation_workers=validation_workers)
+
+
+def list_files(directory):
+    """Return the paths of all files in directory and its subdirectories, relative to directory"""
+    return sorted(os.path.relpath(os.path.join(path, file), directory)
+                  for path, _, files in os.walk(directory) for file in files)
+
+
+class TestExperimentRunner(unittest.TestCase):
+
+    def run_suite(self, directory, workers, suite=None):
+        working_directory = os.getcwd()
+        os.chdir(directory)
+        try:
+            run_experiment_suite(suite or small_suite(), workers=workers)
+        finally:
+            os.chdir(working_directory)
+        return {os.path.basename(file): np.load(os.path.join(directory, file)) for file in list_files(directory)
+                if file.endswith(".npy")}
+
+    def test_parallel_matches_sequential(self):
+        with tempfile.TemporaryDirectory() as sequential_directory, \
+                tempfile.TemporaryDirectory() as parallel_directory:
+            sequential = self.run_suite(sequential_directory, None)
+            parallel = self.run_suite(parallel_directory, 2)
+
+        self.assertIn("SmallExperiment-0.05-model.npy", sequential)
+        self.assertEqual(sequential.keys(), parallel.keys())
+        for file in sequential:
+            assert_array_equal(sequential[file], parallel[file])
+
+    def test_parallel_failure(self):
+        suite = DefaultSuite(FailingExperiment, [{"alpha": 0.1}, {"alpha": 0.05}], episode_count=40,
+                             validation_frequency=20, validation_episode_count=10)
+        with tempfile.TemporaryDirectory() as directory:
+            # The exception of the experiment propagates and the pool is terminated
+            with self.assertRaisesRegex(ValueError, "Experiment failed"):
+                self.run_suite(directory, 2, suite)
+
+    def test_validation_pool(self):
+        with tempfile.TemporaryDirectory() as in_process_directory, \
+                tempfile.TemporaryDirectory() as pool_directory:
+            in_process = self.run_suite(in_process_directory, None, small_suite(validation_workers=1))
+            pooled = self.run_suite(pool_directory, None, small_suite(validation_workers=2))
+
+        self.assertEqual(in_process.keys(), pooled.keys())
+        for file in in_process:
+            assert_array_equal(in_process[file], pooled[file])
+
+    def test_resume(self):
+        def interrupt(experiment, episode):
+            if episode == 30:
+                raise KeyboardInterrupt()
+
+        working_directory = os.getcwd()
+        with tempfile.TemporaryDirectory() as uninterrupted_directory, \
+                tempfile.TemporaryDirectory() as resumed_directory:
+            try:
+                os.chdir(uninterrupted_directory)
+                result = run_experiment(small_suite(), 0)
+                os.chdir(resumed_directory)
+                with self.assertRaises(KeyboardInterrupt):
+                    run_experiment(small_suite(), 0, interrupt)
+                # Continues from the checkpoint after episode 20 without creating the experiment again
+                SmallExperiment.created_count = 0
+                self.assertEqual(result, run_experiment(small_suite(), 0, resume=True))
+                self.assertEqual(0, SmallExperiment.created_count)
+                # Skips the completed experiment
+                self.assertEqual(result, run_experiment(small_suite(), 0, interrupt, resume=True))
+            finally:
+                os.chdir(working_directory)
+
+            files = list_files(uninterrupted_directory)
+            self.assertEqual(files, list_files(resumed_directory))
+            for file in files:
+                if file.endswith(".pkl"):
+                    continue
+                with open(os.path.join(uninterrupted_directory, file), "rb") as uninterrupted, \
+                        open(os.path.join(resumed_directory, file), "rb") as resumed:
+                    self.assertEqual(uninterrupted.read(), resumed.read(), file)
+
+    def test_result_cache(self):
+        with tempfile.TemporaryDirectory() as directory:
+            self.run_suite(directory, None, small_suite([0.1, 0.05]))
+            keys = sorted(os.listdir(os.path.join(directory, "results")))
+            self.assertEqual(2, len(keys))
+            for key in keys:
+                self.assertTrue(os.path.exists(os.path.join(directory, "results", key, "COMPLETE")))
+                self.assertTrue(os.path.exists(os.path.join(directory, "results", key, "config.json")))
+
+            # Only the new configuration of a widened sweep is run
+            SmallExperiment.created_count = 0
+            results = self.run_suite(directory, None, small_suite([0.1, 0.05, 0.02]))
+            self.assertEqual(1, SmallExperiment.created_count)
+            self.assertEqual(3, len(os.listdir(os.path.join(directory, "results"))))
+            self.assertIn("SmallExperiment-0.02-model.npy", results)
+
+            # Different settings give different keys
+            suite = small_suite()
+            self.assertEqual(suite.experiment_key(0), small_suite().experiment_key(0))
+            self.assertNotEqual(suite.experiment_key(0), suite.experiment_key(1))
+            suite.random_seed += 1
+            self.assertNotEqual(suite.experiment_key(0), small_suite().experiment_key(0))
+
+    def test_suite_validate(self):
+        suite = DefaultSuite(SmallExperiment, [{"alpha": 0.1}], episode_count=40, validation_frequency=20,
+                             validation_episode_count=10, validation_ci_half_width=1.0,
+                             validation_min_episode_count=5)
+        np.random.seed(643674)
+        result = suite.validate_with_interval(suite.experiments[0]())
+        np.random.seed(643674)
+        self.assertEqual(result.mean, suite.validate(suite.experiments[0]()))
+        self.assertLessEqual(result.episode_count, 10)
+        self.assertFalse(np.isnan(result.ci_half_width))
+
+    def test_experiment_key_encoding(self):
+        def suite(args):
+            return DefaultSuite(SmallExperiment, [args], episode_count=40, validation_frequency=20,
+                                validation_episode_count=10)
+
+        # Functions and classes are identified by their name, not by their address
+        key = suite({"alpha": 0.1, "factory": create_env, "env": CleanBotEnv}).experiment_key(0)
+        self.assertEqual(key, suite({"alpha": 0.1, "factory": create_env, "env": CleanBotEnv}).experiment_key(0))
+        self.assertNotEqual(key, suite({"alpha": 0.1, "factory": small_suite, "env": CleanBotEnv}).experiment_key(0))
+        self.assertEqual(suite({"alpha": 0.1, "size": 3}).experiment_key(0),
+                         suite({"alpha": 0.1, "size": np.int64(3)}).experiment_key(0))
+        self.assertEqual(suite({"alpha": 0.1, "factory": functools.partial(CleanBotEnv, 3)}).experiment_key(0),
+                         suite({"alpha": 0.1, "factory": functools.partial(CleanBotEnv, 3)}).experiment_key(0))
+        self.assertNotEqual(suite({"alpha": 0.1, "factory": functools.partial(CleanBotEnv, 3)}).experiment_key(0),
+                            suite({"alpha": 0.1, "factory": functools.partial(CleanBotEnv, 4)}).experiment_key(0))
+
+        # Experiments with values that cannot be identified have no key and are not cached
+        self.assertIsNone(suite({"alpha": 0.1, "env": CleanBotEnv(3)}).experiment_key(0))
+        self.assertIsNone(suite({"alpha": 0.1, "reward": lambda x: x}).experiment_key(0))
+        self.assertIsNone(suite({"alpha": 0.1, "factory": create_env_factory(3)}).experiment_key(0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,3 +1,4 @@
+import pickle
 import unittest
 import numpy as np
 from CleanBotEnv import CleanBotEnv
@@ -43,6 +44,116 @@ class TestKerasModel(unittest.TestCase):
         # Check that the error decreased
         self.assertGreater(mean_square_error1, mean_square_error2)
 
+    def test_batch(self):
+        env = MockEnv(3)
+        model = KerasModel(env, model=conv1_model(env), batch_size=4)
+        states = np.array([env.reset(), env.step(EAST)[0], env.step(SOUTH)[0]])
+
+        expected = np.array([model.state_values(state) for state in states])
+        np.testing.assert_allclose(model.model.predict(states.reshape(3, 3, 3, 1) / 2, verbose=0), expected,
+                                   rtol=1e-4, atol=1e-5)
+        np.testing.assert_allclose(expected, model.state_values_batch(states), rtol=1e-5, atol=1e-6)
+        np.testing.assert_allclose(expected[[0, 1, 2], [EAST, SOUTH, CLEAN]],
+                                   model.action_values_batch(states, [EAST, SOUTH, CLEAN]), rtol=1e-5, atol=1e-6)
+
+        model.update_action_values_batch(states, [EAST, SOUTH, CLEAN], [1, 2, 3])
+        self.assertEqual(3, model._collected_count)
+
+        # The targets of the actions not taken are the predictions right before fitting
+        model.update_action_value(states[0], CLEAN, 4)
+        np.testing.assert_allclose(expected[2, :4], model._y_train[2, :4], rtol=1e-5, atol=1e-6)
+        self.assertEqual(3, model._y_train[2, CLEAN])
+        self.assertEqual(4, model._y_train[3, CLEAN])
+        np.testing.assert_allclose(expected[0, :4], model._y_train[3, :4], rtol=1e-5, atol=1e-6)
+
+    def test_cache(self):
+        env = MockEnv(3)
+        model = KerasModel(env, model=conv1_model(env), batch_size=2, cache_size=2)
+        obs1 = env.reset()
+        obs2 = env.step(EAST)[0]
+        obs3 = env.step(SOUTH)[0]
+
+        values = model.state_values(obs1)
+        values[EAST] = 100
+        np.testing.assert_array_equal(model.state_values(obs1), model.state_values(obs1.astype(np.uint8)))
+        self.assertNotEqual(100, model.state_values(obs1)[EAST])
+        self.assertEqual(3, model.cache_hits)
+        self.assertEqual(1, model.cache_misses)
+
+        # The least recently used prediction is evicted
+        model.state_values(obs2)
+        model.state_values(obs3)
+        model.state_values(obs1)
+        self.assertEqual(3, model.cache_hits)
+        self.assertEqual(4, model.cache_misses)
+
+        # Fitting the model invalidates the cache
+        model.update_action_value(obs1, EAST, 10)
+        model.update_action_value(obs2, EAST, 10)
+        model.state_values(obs1)
+        self.assertEqual(5, model.cache_misses)
+        self.assertAlmostEqual(3 / 8, model.cache_hit_rate)
+
+    def test_async_training(self):
+        np.random.seed(643674)
+        env = CleanBotEnv(3)
+        model = KerasModel(env, model=conv1_model(env), batch_size=8, async_training=True)
+        model.epochs = 2
+        mc = AlphaMC(env, model, EpsilonGreedyPolicy(model, 0.1))
+        for i in range(5):
+            mc.run_episode()
+        model.wait_for_training()
+
+        self.assertGreater(model.async_metrics.submitted_batches, 0)
+        self.assertEqual(model.async_metrics.submitted_batches, model.async_metrics.published_batches)
+        self.assertEqual(0, model.async_metrics.staleness)
+        self.assertGreaterEqual(model.async_metrics.max_staleness, 1)
+        obs = env.reset()
+        np.testing.assert_allclose(model.model.predict(obs.reshape(1, 3, 3, 1) / 2, verbose=0)[0],
+                                   model.state_values(obs), rtol=1e-4, atol=1e-5)
+
+        # The trainer stops and the model continues to fit synchronously
+        thread = model._training_thread
+        model.close()
+        self.assertFalse(thread.is_alive())
+        submitted_batches = model.async_metrics.submitted_batches
+        mc.run_episode()
+        self.assertEqual(submitted_batches, model.async_metrics.submitted_batches)
+
+    def test_close_raises_training_error(self):
+        env = CleanBotEnv(3)
+        model = KerasModel(env, model=conv1_model(env), batch_size=4, async_training=True)
+
+        def fail(x_train, actions, targets):
+            raise ValueError("Fit failed")
+        model._fit = fail
+        states = np.array([env.reset() for i in range(4)])
+        model.update_action_values_batch(states, [EAST, SOUTH, CLEAN, WEST], [1, 2, 3, 4])
+        with self.assertRaisesRegex(ValueError, "Fit failed"):
+            model.close()
+
+    def test_pickle(self):
+        np.random.seed(643674)
+        env = CleanBotEnv(3)
+        model = KerasModel(env, model=conv1_model(env), batch_size=4, async_training=True)
+        model.epochs = 2
+        mc = AlphaMC(env, model, EpsilonGreedyPolicy(model, 0.1))
+        mc.run_episode()
+
+        copy = pickle.loads(pickle.dumps(model))
+        states = np.array([env.reset() for i in range(4)])
+        np.testing.assert_array_equal(model.state_values_batch(states), copy.state_values_batch(states))
+        self.assertIsNotNone(copy._training_queue)
+
+        # Both continue to train in the same way
+        for target in (model, copy):
+            target.update_action_values_batch(states, [EAST, SOUTH, CLEAN, WEST], [1, 2, 3, 4])
+            target.wait_for_training()
+        np.testing.assert_allclose(model.state_values_batch(states), copy.state_values_batch(states),
+                                   rtol=1e-5, atol=1e-6)
+        model.close()
+        copy.close()
+
     def test_smoke(self):
         np.random.seed(643674)
         env = CleanBotEnv(3)
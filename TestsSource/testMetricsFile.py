@@ -0,0 +1,84 @@
+import os
+import pickle
+import tempfile
+import unittest
+import numpy as np
+from numpy.testing import assert_array_equal
+
+from Utilities.Eval import MetricsLogger
+from Utilities.MetricsFile import MetricsFileReader
+
+
+class Metrics:
+    def __init__(self):
+        self.cat_count = 0
+        self.dog_count = 0
+
+
+class TestMetricsFile(unittest.TestCase):
+
+    def test_stream_and_read(self):
+        metrics = Metrics()
+        with tempfile.TemporaryDirectory() as directory:
+            file = os.path.join(directory, "metrics.bin")
+            logger = MetricsLogger(metrics, max_length=3, file=file, chunk_size=4)
+            reader = MetricsFileReader(file, max_length=None)
+            self.assertEqual(["cat_count", "dog_count"], reader.keys)
+            self.assertEqual(0, reader.count)
+            assert_array_equal([], reader.data["cat_count"])
+
+            for i in range(6):
+                metrics.cat_count = i
+                metrics.dog_count = -i
+                logger.append(metrics)
+
+            # Only the complete chunk has been committed
+            reader.refresh()
+            self.assertEqual(4, reader.count)
+            assert_array_equal([0, 1, 2, 3], reader.data["cat_count"])
+            self.assertEqual(3, reader.max["cat_count"])
+
+            # Pickling and unpickling do not write to the file, but a copy writes the rows it holds once it is used
+            copy = pickle.loads(pickle.dumps(logger))
+            copy.close()
+            reader.refresh()
+            self.assertEqual(4, reader.count)
+            copy = pickle.loads(pickle.dumps(logger))
+            copy.flush()
+            reader.refresh()
+            self.assertEqual(6, reader.count)
+            copy.close()
+
+            logger.flush()
+            reader.refresh()
+            self.assertEqual(6, reader.count)
+            self.assertEqual(5, reader.upper_bound)
+            assert_array_equal([0, -1, -2, -3, -4, -5], reader.data["dog_count"])
+            self.assertEqual(-5, reader.min["dog_count"])
+
+            for i in range(6, 10):
+                metrics.cat_count = i
+                metrics.dog_count = float("nan") if i == 7 else -i
+                logger.append(metrics)
+            logger.close()
+            # The logger only keeps the last values in memory, the file holds all of them
+            assert_array_equal([7, 8, 9], logger.data["cat_count"])
+
+            window = MetricsFileReader(file, max_length=5)
+            self.assertEqual(5, window.lower_bound)
+            self.assertEqual(9, window.upper_bound)
+            assert_array_equal([5, 6, 7, 8, 9], window.data["cat_count"])
+            assert_array_equal([-5, -6, np.nan, -8, -9], window.data["dog_count"])
+            self.assertEqual(-9, window.min["dog_count"])
+            assert_array_equal([7, 8, 9], window.tail("cat_count", 3))
+            assert_array_equal(np.arange(10), window.tail("cat_count", 20))
+            # Values within a chunk are not copied
+            self.assertIsInstance(window.tail("cat_count", 2).base, np.memmap)
+            assert_array_equal([8, 9], logger.tail("cat_count", 2))
+            self.assertEqual((3, 4), window.chunks("cat_count").shape)
+            assert_array_equal(np.arange(10), window.chunks("cat_count").reshape(-1)[:window.row_count])
+            del reader, window
+
+
+if __name__ == '__main__':
+    unittest.main()
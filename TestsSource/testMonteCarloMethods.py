@@ -1,6 +1,8 @@
 import unittest
 import numpy as np
 from CleanBotEnv import CleanBotEnv
+from KerasModelBuilders import conv1_model
+from Models.KerasModel import KerasModel
 from Models.TableModel import TableModel
 from Methods.MonteCarlo import AveragingMC, AlphaMC
 from Policies import EpsilonGreedyPolicy, GreedyPolicy
@@ -98,6 +100,16 @@ class TestConstAlphaMonteCarlo(unittest.TestCase):
         self.assertEqual(mc.metrics.max_action_value_delta, 0.0796000000089407)
         self.assertEqual(greedy_policy.choose_action(initial_obs), SOUTH)
 
+    def test_large_observation_space(self):
+        """Models that do not use state ids support environments whose observations do not fit into 64 bits"""
+        np.random.seed(643674)
+        env = CleanBotEnv(8)
+        model = KerasModel(env, model=conv1_model(env), batch_size=32)
+        mc = AlphaMC(env, model, EpsilonGreedyPolicy(model, 0.1))
+        reward = mc.run_episode()
+        self.assertEqual(reward, mc.metrics.episode_reward)
+        self.assertIsNotNone(mc.metrics.rms)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,53 @@
+import unittest
+import numpy as np
+import keras
+from keras.models import Sequential
+from keras.layers import Dense, Flatten, Conv2D, MaxPooling2D, Dropout
+from CleanBotEnv import CleanBotEnv
+from Models.NumpyInference import NumpyForwardPass
+from KerasModelBuilders import conv1_model, conv2_model
+
+
+class TestNumpyForwardPass(unittest.TestCase):
+
+    def check_predictions(self, model, width):
+        np.random.seed(643674)
+        x = np.random.randint(3, size=(17, width, width, 1)) / 2.0
+        np.testing.assert_allclose(model.predict(x, verbose=0), NumpyForwardPass(model).predict(x),
+                                   rtol=1e-4, atol=1e-5)
+
+    def test_conv1_model(self):
+        self.check_predictions(conv1_model(CleanBotEnv(4)), 4)
+
+    def test_conv2_model(self):
+        self.check_predictions(conv2_model(CleanBotEnv(7)), 7)
+
+    def test_padding_and_strides(self):
+        model = Sequential()
+        model.add(Conv2D(8, kernel_size=(3, 2), strides=(2, 1), padding='same', activation='tanh',
+                         input_shape=(5, 5, 1)))
+        model.add(MaxPooling2D(pool_size=(2, 2), strides=(1, 2), padding='same'))
+        model.add(Dropout(0.5))
+        model.add(Flatten())
+        model.add(Dense(3, activation='softmax'))
+        self.check_predictions(model, 5)
+
+    def test_load_weights(self):
+        model = conv1_model(CleanBotEnv(3))
+        forward_pass = NumpyForwardPass(model)
+        np.random.seed(643674)
+        x = np.random.randint(3, size=(4, 3, 3, 1)) / 2.0
+        model.fit(x, np.ones((4, 5)), epochs=5, verbose=0)
+        self.assertFalse(np.allclose(model.predict(x, verbose=0), forward_pass.predict(x), rtol=1e-4, atol=1e-5))
+        forward_pass.load_weights(model)
+        np.testing.assert_allclose(model.predict(x, verbose=0), forward_pass.predict(x), rtol=1e-4, atol=1e-5)
+
+    def test_unsupported_layer(self):
+        model = Sequential()
+        model.add(keras.layers.BatchNormalization(input_shape=(3, 3, 1)))
+        with self.assertRaises(ValueError):
+            NumpyForwardPass(model)
+
+
+if __name__ == "__main__":
+    unittest.main()
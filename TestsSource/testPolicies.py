@@ -0,0 +1,49 @@
+import unittest
+import numpy as np
+from CleanBotEnv import CleanBotEnv, VecCleanBotEnv
+from Models.TableModel import TableModel
+from Policies import GreedyPolicy, EpsilonGreedyPolicy
+from utilities import MockEnv
+
+
+class TestPolicies(unittest.TestCase):
+
+    def setUp(self):
+        np.random.seed(643674)
+        self.env = MockEnv(3)
+        self.model = TableModel(self.env)
+        self.obs = self.env.reset()
+        for action, value in enumerate([1, 1, 0, 1, 0]):
+            self.model.update_action_value(self.obs, action, value)
+
+    def action_frequencies(self, actions):
+        return np.bincount(actions, minlength=5) / len(actions)
+
+    def test_greedy_tie_breaking(self):
+        """Ties are broken uniformly at random like choose_action does"""
+        policy = GreedyPolicy(self.model)
+        states = np.repeat(self.obs[np.newaxis], 30000, axis=0)
+        expected = self.action_frequencies([policy.choose_action(self.obs) for _ in range(30000)])
+        actual = self.action_frequencies(policy.choose_actions(states))
+        np.testing.assert_allclose([1 / 3, 1 / 3, 0, 1 / 3, 0], actual, atol=0.01)
+        np.testing.assert_allclose(expected, actual, atol=0.015)
+
+    def test_epsilon_greedy(self):
+        policy = EpsilonGreedyPolicy(self.model, exploration=0.5)
+        self.model.update_action_value(self.obs, 1, 2)
+        states = np.repeat(self.obs[np.newaxis], 30000, axis=0)
+        np.testing.assert_allclose([0.1, 0.6, 0.1, 0.1, 0.1], self.action_frequencies(policy.choose_actions(states)),
+                                   atol=0.01)
+
+    def test_vectorized_env(self):
+        env = VecCleanBotEnv(3, 8)
+        policy = EpsilonGreedyPolicy(TableModel(CleanBotEnv(3)), exploration=0.1)
+        observations = env.reset()
+        for step in range(50):
+            actions = policy.choose_actions(observations)
+            self.assertEqual((8, ), actions.shape)
+            observations, rewards, dones, info = env.step(actions)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,58 @@
+import unittest
+import numpy as np
+from CleanBotEnv import CleanBotEnv
+from Models.KerasModel import KerasModel
+from Methods.MonteCarlo import AlphaMC
+from Policies import EpsilonGreedyPolicy
+from Utilities.Replay import ReplayBuffer, PrioritizedReplayBuffer
+from KerasModelBuilders import conv1_model
+
+
+class TestReplayBuffer(unittest.TestCase):
+
+    def test_ring_buffer(self):
+        np.random.seed(643674)
+        replay = ReplayBuffer(4, (2, 2))
+        for i in range(6):
+            replay.add(np.full((2, 2), i), i, i * 10)
+
+        self.assertEqual(4, len(replay))
+        np.testing.assert_array_equal([4, 5, 2, 3], replay.actions)
+        np.testing.assert_array_equal([40, 50, 20, 30], replay.targets)
+        np.testing.assert_array_equal(np.full((2, 2), 5), replay.obs[1])
+
+        indices, weights = replay.sample(100)
+        self.assertTrue(np.all((indices >= 0) & (indices < 4)))
+        np.testing.assert_array_equal(np.ones(100), weights)
+
+    def test_prioritized_sampling(self):
+        np.random.seed(643674)
+        replay = PrioritizedReplayBuffer(5, (1, ), alpha=1.0, beta=1.0, epsilon=0.0)
+        for i in range(5):
+            replay.add([i], i, 0)
+        replay.update_priorities(np.arange(5), np.array([1, 2, 3, 4, 0]))
+
+        indices, weights = replay.sample(10000)
+        frequencies = np.bincount(indices, minlength=5) / len(indices)
+        np.testing.assert_allclose([0.1, 0.2, 0.3, 0.4, 0], frequencies, atol=0.01)
+        # Importance sampling weights are inversely proportional to the priorities
+        np.testing.assert_allclose(1 / (indices + 1), weights, rtol=1e-5)
+
+        # New experience gets the maximum priority so far and overwrites the oldest
+        replay.add([5], 5, 0)
+        np.testing.assert_allclose(13, replay._tree[1])
+
+    def test_keras_model(self):
+        np.random.seed(643674)
+        env = CleanBotEnv(3)
+        replay = PrioritizedReplayBuffer(64, env.observation_space.shape)
+        model = KerasModel(env, model=conv1_model(env), replay_buffer=replay, minibatch_size=8, train_frequency=2)
+        mc = AlphaMC(env, model, EpsilonGreedyPolicy(model, 0.1))
+        for i in range(5):
+            mc.run_episode()
+        self.assertGreater(len(replay), 8)
+        self.assertEqual(0, model._collected_count)
+
+
+if __name__ == "__main__":
+    unittest.main()
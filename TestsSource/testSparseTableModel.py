@@ -0,0 +1,65 @@
+import unittest
+import numpy as np
+from CleanBotEnv import CleanBotEnv
+from Models.TableModel import TableModel
+from Models.SparseTableModel import SparseTableModel
+from Methods.MonteCarlo import AlphaMC
+from Policies import EpsilonGreedyPolicy
+from Utilities.Env import obs_weights, to_state_id
+from utilities import MockEnv
+
+EAST = CleanBotEnv.BotActions.EAST.value
+CLEAN = CleanBotEnv.BotActions.CLEAN.value
+
+
+class TestSparseTableModel(unittest.TestCase):
+
+    def test_default_value(self):
+        env = MockEnv(3)
+        model = SparseTableModel(env, default_value=2.5)
+        obs = env.reset()
+
+        np.testing.assert_array_equal(np.full(5, 2.5), model.state_values(obs))
+        model.update_action_value(obs, EAST, 7)
+        self.assertEqual(7, model.action_value(obs, EAST))
+        self.assertEqual(2.5, model.action_value(obs, CLEAN))
+        self.assertEqual(1, model.state_count)
+
+    def test_state_ids(self):
+        """Both table models accept state ids in place of observations"""
+        env = MockEnv(3)
+        obs = env.reset()
+        state_id = np.int64(to_state_id(obs, obs_weights(env)))
+        for model in [TableModel(env), SparseTableModel(env)]:
+            model.update_action_value(state_id, EAST, 3)
+            model.update_action_value(obs, CLEAN, 4)
+            np.testing.assert_array_equal([0, 3, 0, 0, 4], model.state_values(obs))
+            np.testing.assert_array_equal([0, 3, 0, 0, 4], model.state_values(state_id))
+            self.assertEqual(4, model.action_value(state_id, CLEAN))
+
+    def test_matches_table_model(self):
+        """Train a table model and a sparse table model the same way and compare the action values"""
+        def train(model):
+            np.random.seed(643674)
+            env = CleanBotEnv(3)
+            mc = AlphaMC(env, model, EpsilonGreedyPolicy(model, 0.1))
+            mc.alpha = 0.1
+            return [mc.run_episode() for _ in range(200)]
+
+        env = CleanBotEnv(3)
+        table_model = TableModel(env)
+        # Start small to force the table to grow a number of times
+        sparse_model = SparseTableModel(env, initial_capacity=4)
+        self.assertEqual(train(table_model), train(sparse_model))
+
+        stored_keys = sparse_model._keys[sparse_model._keys != SparseTableModel._EMPTY]
+        self.assertEqual(len(stored_keys), sparse_model.state_count)
+        for key in stored_keys:
+            state = np.array(np.unravel_index(key, (3, ) * 9)).reshape(3, 3)
+            np.testing.assert_array_equal(table_model.state_values(state), sparse_model.state_values(state))
+        self.assertEqual(np.count_nonzero(table_model.value_function),
+                         np.count_nonzero(sparse_model._values[sparse_model._keys != SparseTableModel._EMPTY]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+import unittest
+import numpy as np
+from CleanBotEnv import CleanBotEnv
+from Models.TableModel import TableModel
+from Model import Model
+from Utilities.Env import obs_weights, to_state_ids
+from utilities import MockEnv
+
+EAST = CleanBotEnv.BotActions.EAST.value
+SOUTH = CleanBotEnv.BotActions.SOUTH.value
+CLEAN = CleanBotEnv.BotActions.CLEAN.value
+
+
+class TestTableModel(unittest.TestCase):
+
+    def test_batch_updates(self):
+        env = MockEnv(3)
+        model = TableModel(env)
+        states = np.array([env.reset(), env.step(EAST)[0], env.step(SOUTH)[0]])
+        state_ids = to_state_ids(states, obs_weights(env))
+
+        model.update_action_values_batch(states, [EAST, SOUTH, CLEAN], [1, 2, 3])
+        np.testing.assert_array_equal([1, 2, 3], model.action_values_batch(state_ids, [EAST, SOUTH, CLEAN]))
+        np.testing.assert_array_equal([[0, 1, 0, 0, 0], [0, 0, 2, 0, 0], [0, 0, 0, 0, 3]],
+                                      model.state_values_batch(states))
+
+        # Deltas of repeated state-action pairs add up
+        model.increment_action_values_batch(state_ids[[0, 0, 2]], [EAST, EAST, CLEAN], [0.5, 0.25, 1])
+        np.testing.assert_array_equal([1.75, 2, 4], model.action_values_batch(states, [EAST, SOUTH, CLEAN]))
+
+        # The generic implementation of the base class behaves the same
+        generic_model = TableModel(env)
+        Model.update_action_values_batch(generic_model, states, [EAST, SOUTH, CLEAN], [1, 2, 3])
+        Model.increment_action_values_batch(generic_model, states[[0, 0, 2]], [EAST, EAST, CLEAN], [0.5, 0.25, 1])
+        np.testing.assert_array_equal(model.value_function, generic_model.value_function)
+        np.testing.assert_array_equal(model.state_values_batch(states), Model.state_values_batch(generic_model, states))
+
+    def test_greedy_actions(self):
+        env = MockEnv(3)
+        model = TableModel(env)
+        states = np.array([env.reset(), env.step(EAST)[0]])
+        state_ids = to_state_ids(states, obs_weights(env))
+        self.assertEqual(-1, model.greedy_action(states[0]))
+
+        model.update_action_value(states[0], SOUTH, 1)
+        self.assertEqual(SOUTH, model.greedy_action(states[0]))
+        model.update_action_value(states[0], CLEAN, 1)
+        self.assertEqual(-1, model.greedy_action(states[0]))
+
+        model.update_action_values_batch(states, [EAST, CLEAN], [2, -1])
+        np.testing.assert_array_equal([EAST, -1], model.greedy_actions_batch(state_ids))
+        model.increment_action_values_batch(states, [EAST, EAST], [-2, 1])
+        np.testing.assert_array_equal([-1, EAST], model.greedy_actions_batch(states))
+
+        # Ties are resolved towards the lowest action when exporting
+        policy = model.export_greedy_policy()
+        self.assertEqual(np.int8, policy.dtype)
+        self.assertEqual(model.shape[0], len(policy))
+        np.testing.assert_array_equal([SOUTH, EAST], policy[state_ids])
+        self.assertEqual(0, policy[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,128 @@
+import unittest
+import numpy as np
+from CleanBotEnv import CleanBotEnv, VecCleanBotEnv
+from KerasModelBuilders import conv1_model
+from Models.KerasModel import KerasModel
+from Models.TableModel import TableModel
+from Models.SparseTableModel import SparseTableModel
+from Methods.TemporalDifference import SarsaLambda, NStepSarsa, VectorizedTD
+from Policies import EpsilonGreedyPolicy
+from utilities import MockEnv, MockPolicy, MockVectorPolicy, ObservationTableModel
+
+SOUTH = CleanBotEnv.BotActions.SOUTH.value
+EAST = CleanBotEnv.BotActions.EAST.value
+WEST = CleanBotEnv.BotActions.WEST.value
+CLEAN = CleanBotEnv.BotActions.CLEAN.value
+
+
+class TestSarsaLambda(unittest.TestCase):
+
+    def test_traces(self):
+        env = MockEnv(3)
+        obs_0 = env.reset()
+        obs_1 = env.step(EAST)[0]
+        env.reset()
+        obs_3 = env.step(SOUTH)[0]
+        # Traces are keyed by state ids or, for models that do not accept them, by observations
+        for model in [TableModel(env), ObservationTableModel(env)]:
+            sarsa = SarsaLambda(env, model, MockPolicy([EAST, WEST, SOUTH, CLEAN]), alpha=0.5, gamma=0.9,
+                                trace_decay=0.8, trace_threshold=0.5)
+            sarsa.run_episode()
+
+            # The reward reaches all state-action pairs whose decayed trace has not dropped below the threshold
+            self.assertEqual(14, sarsa.metrics.episode_reward)
+            self.assertAlmostEqual(7, model.action_value(obs_3, CLEAN), places=5)
+            self.assertAlmostEqual(0.5 * 14 * 0.72, model.action_value(obs_0, SOUTH), places=5)
+            self.assertAlmostEqual(0.5 * 14 * 0.72 ** 2, model.action_value(obs_1, WEST), places=5)
+            self.assertEqual(0, model.action_value(obs_0, EAST))
+            self.assertAlmostEqual(7, sarsa.metrics.max_action_value_delta, places=5)
+
+    def test_smoke(self):
+        np.random.seed(643674)
+        env = CleanBotEnv(3)
+        for model in [TableModel(env), SparseTableModel(env)]:
+            sarsa = SarsaLambda(env, model, EpsilonGreedyPolicy(model, 0.1), alpha=0.1)
+            for i in range(50):
+                sarsa.run_episode()
+
+    def test_large_observation_space(self):
+        np.random.seed(643674)
+        env = CleanBotEnv(8)
+        model = KerasModel(env, model=conv1_model(env), batch_size=32)
+        sarsa = SarsaLambda(env, model, EpsilonGreedyPolicy(model, 0.1))
+        self.assertEqual(sarsa.run_episode(), sarsa.metrics.episode_reward)
+
+
+class TestNStepSarsa(unittest.TestCase):
+
+    def test_returns(self):
+        env = MockEnv(3)
+        obs_0 = env.reset()
+        obs_3 = env.step(SOUTH)[0]
+        model = TableModel(env)
+        sarsa = NStepSarsa(env, model, MockPolicy([EAST, WEST, SOUTH, CLEAN]), n=2, alpha=0.5, gamma=0.9)
+        sarsa.run_episode()
+
+        self.assertEqual(14, sarsa.metrics.episode_reward)
+        self.assertAlmostEqual(7, model.action_value(obs_3, CLEAN), places=5)
+        self.assertAlmostEqual(0.5 * 0.9 * 14, model.action_value(obs_0, SOUTH), places=5)
+        self.assertEqual(0, model.action_value(obs_0, EAST))
+
+    def test_smoke(self):
+        np.random.seed(643674)
+        env = CleanBotEnv(3)
+        model = TableModel(env)
+        sarsa = NStepSarsa(env, model, EpsilonGreedyPolicy(model, 0.1), alpha=0.1)
+        for i in range(50):
+            sarsa.run_episode()
+
+    def test_large_observation_space(self):
+        np.random.seed(643674)
+        env = CleanBotEnv(8)
+        model = KerasModel(env, model=conv1_model(env), batch_size=32)
+        sarsa = NStepSarsa(env, model, EpsilonGreedyPolicy(model, 0.1))
+        self.assertEqual(sarsa.run_episode(), sarsa.metrics.episode_reward)
+
+
+class TestVectorizedTD(unittest.TestCase):
+
+    def test_variants(self):
+        for variant in [VectorizedTD.SARSA, VectorizedTD.EXPECTED_SARSA, VectorizedTD.Q_LEARNING]:
+            np.random.seed(643674)
+            env = VecCleanBotEnv(3, 8)
+            model = TableModel(CleanBotEnv(3))
+            td = VectorizedTD(env, model, EpsilonGreedyPolicy(model, 0.1), alpha=0.1, variant=variant)
+
+            rewards = [td.run_episode() for _ in range(100)]
+            self.assertEqual(rewards[-1], td.metrics.episode_reward)
+            self.assertGreater(td.metrics.max_action_value_delta, 0)
+            self.assertTrue(all(0 <= reward <= 4 * env.max_steps for reward in rewards))
+            self.assertGreater(np.count_nonzero(model.value_function), 0)
+
+    def test_terminal_update(self):
+        """The update of the final step of an episode does not bootstrap from the next episode"""
+        np.random.seed(643674)
+        env = VecCleanBotEnv(3, 1)
+        env.state[0] = 0
+        env.state[0, 0, 0] = CleanBotEnv.TileState.DIRTY.value
+        env.dirty_count[0] = 1
+        model = TableModel(CleanBotEnv(3))
+        td = VectorizedTD(env, model, MockVectorPolicy(), alpha=0.5, gamma=0.9, variant=VectorizedTD.Q_LEARNING)
+        td._states = td._encode(env._get_obs())
+        td._actions = np.array([CLEAN])
+        model.value_function[:] = 100
+
+        self.assertEqual(17, td.run_episode())
+        dirty_obs = np.array([[1, 0, 0], [0, 0, 0], [0, 0, 0]])
+        self.assertEqual(0.5 * 100 + 0.5 * 17, model.action_value(dirty_obs, CLEAN))
+
+    def test_large_observation_space(self):
+        np.random.seed(643674)
+        env = VecCleanBotEnv(8, 2)
+        model = KerasModel(CleanBotEnv(8), model=conv1_model(CleanBotEnv(8)), batch_size=32)
+        td = VectorizedTD(env, model, EpsilonGreedyPolicy(model, 0.1))
+        self.assertEqual(td.run_episode(), td.metrics.episode_reward)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,5 +1,6 @@
 import numpy as np
 from CleanBotEnv import CleanBotEnv
+from Models.TableModel import TableModel
 from Policies import EpsilonGreedyPolicy
 
 
@@ -17,6 +18,17 @@ class MockPolicy(EpsilonGreedyPolicy):
         self.current += 1
         return action
 
+    def choose_action_from_values(self, action_values):
+        return self.choose_action(None)
+
+
+class MockVectorPolicy:
+    """
+    Policy for vectorized environments that always cleans
+    """
+    def choose_actions_from_values(self, action_values):
+        return np.full(len(action_values), CleanBotEnv.BotActions.CLEAN.value)
+
 
 class MockEnv(CleanBotEnv):
     """
@@ -29,3 +41,10 @@ class MockEnv(CleanBotEnv):
         self.dirty_count = 1
         self.state = np.array([[0, 0, 0], [1, 0, 0], [0, 0, 0]], dtype=np.int)
         return self._get_obs()
+
+
+class ObservationTableModel(TableModel):
+    """
+    TableModel that does not accept state ids, so methods pass it observations like any model that is not table based
+    """
+    accepts_state_ids = False